@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+CODECS = ["gzip", "br", "zstd"]
+CODEC_EXTENSIONS = {"gzip": "gz", "br": "br", "zstd": "zst"}
+CODEC_DEFAULT_LEVELS = {"gzip": 9, "br": 11, "zstd": 19}
+
+
+def gzipBytes(payload, level=9):
+    """
+    Compress payload with a fixed gzip header (no timestamp, no filename), so
+    the output depends only on the payload.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(filename="", mode="wb", fileobj=buffer, compresslevel=level, mtime=0) as f:
+        f.write(payload)
+    return buffer.getvalue()
+
+
+class Codec:
+    """
+    A compression codec given by a specification "name[:level]", e.g., "br:11"
+    """
+    def __init__(self, spec):
+        name, _, level = spec.partition(":")
+        if name not in CODECS:
+            raise ValueError(f"Unknown codec {name}, use one of {', '.join(CODECS)}")
+        self.name = name
+        self.level = int(level) if level else CODEC_DEFAULT_LEVELS[name]
+        self.extension = CODEC_EXTENSIONS[name]
+        # Brotli and zstd are optional dependencies needed only when requested
+        if name == "br":
+            try:
+                import brotli
+            except ImportError:
+                raise ValueError("Codec br requires the brotli package") from None
+            self._compress = lambda payload: brotli.compress(payload, quality=self.level)
+        elif name == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("Codec zstd requires the zstandard package") from None
+            self._compress = lambda payload: zstandard.ZstdCompressor(level=self.level).compress(payload)
+        else:
+            self._compress = lambda payload: gzipBytes(payload, self.level)
+
+    @property
+    def spec(self):
+        return f"{self.name}:{self.level}"
+
+    def compress(self, payload):
+        return self._compress(payload)
+
+
+def parseCodecs(specs):
+    """
+    Parse codec specifications. The first codec is always gzip as that is what
+    the frontend reads; the others are used for precompressed variants.
+    """
+    codecs = [Codec(spec) for spec in specs]
+    gzipCodecs = [codec for codec in codecs if codec.name == "gzip"]
+    if len(gzipCodecs) > 1 or len(set(codec.name for codec in codecs)) != len(codecs):
+        raise ValueError("Every codec can be specified only once")
+    primary = gzipCodecs[0] if gzipCodecs else Codec("gzip")
+    return [primary] + [codec for codec in codecs if codec.name != "gzip"]
+
+
+def variantName(name, codec):
+    """
+    Name of a precompressed variant of a gzip-compressed artifact
+    """
+    base = name[:-len(".gz")] if name.endswith(".gz") else name
+    return f"{base}.{codec.extension}"
+
+
+def _storeFile(path, data, previousSha256):
+    """
+    Write data unless the file already holds data with the previous hash.
+    Return the file info.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    if previousSha256 != sha256 or not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return {"sha256": sha256, "size": len(data)}
+
+
+class ArtifactWriter:
+    """
+    Compresses, hashes and writes artifacts in a pool of background threads,
+    so the builder can extract the next shard meanwhile. Hashes are computed
+    from the compressed bytes before they are written; files are never read
+    back.
+
+    Every artifact is compressed by the primary gzip codec; additional codecs
+    produce precompressed variants stored side by side. An artifact whose
+    content didn't change since the previous build is not rewritten.
+    """
+    def __init__(self, outdir, codecs=None, jobs=1):
+        self.outdir = outdir
+        self.codecs = codecs or [Codec("gzip")]
+        jobs = jobs or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        # Bound the number of payloads waiting in memory
+        self.slots = threading.BoundedSemaphore(2 * jobs)
+
+    def _store(self, name, payload, compress, previous):
+        previous = previous or {}
+        path = os.path.join(self.outdir, name)
+        if not compress:
+            return _storeFile(path, payload, previous.get("sha256"))
+        primary, *others = self.codecs
+        info = _storeFile(path, primary.compress(payload), previous.get("sha256"))
+        info["codec"] = primary.spec
+        if others:
+            previousVariants = previous.get("variants", {})
+            info["variants"] = {}
+            for codec in others:
+                vName = variantName(name, codec)
+                vPrevious = previousVariants.get(codec.name, {})
+                vInfo = _storeFile(
+                    os.path.join(self.outdir, vName),
+                    codec.compress(payload),
+                    vPrevious.get("sha256") if vPrevious.get("codec") == codec.spec else None)
+                info["variants"][codec.name] = {"name": vName, "codec": codec.spec, **vInfo}
+        return info
+
+    def write(self, name, payload, compress=True, previous=None):
+        """
+        Schedule writing of an artifact. Return a future of the file info:
+        its sha256, size and precompressed variants.
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._store, name, payload, compress, previous)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def keep(self, name, previous):
+        """
+        Keep an artifact of the previous build as it is. Return a future of its
+        file info, or None if the artifact or some of its variants are missing
+        or were compressed differently.
+        """
+        variants = previous.get("variants", {})
+        names = [name] + [variants.get(codec.name, {}).get("name") for codec in self.codecs[1:]]
+        codecsMatch = previous.get("codec") == self.codecs[0].spec and all(
+            variants.get(codec.name, {}).get("codec") == codec.spec
+            for codec in self.codecs[1:])
+        if not codecsMatch or not all(
+                x is not None and os.path.exists(os.path.join(self.outdir, x)) for x in names):
+            return None
+        info = {"sha256": previous["sha256"],
+                "size": os.path.getsize(os.path.join(self.outdir, name)),
+                "codec": previous["codec"]}
+        if len(self.codecs) > 1:
+            info["variants"] = {codec.name: variants[codec.name] for codec in self.codecs[1:]}
+        future = Future()
+        future.set_result(info)
+        return future
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,420 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+import time
+
+import click
+
+from jlcparts.datatables import joinAttributeValue, readShardRows
+from jlcparts.partLib import PartLibraryDb
+from jlcparts.searchindex import normalizeMpn
+from jlcparts.webdb import PRICES_AT_QUANTITY_QUERY
+
+
+def _bestTime(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command()
+@click.argument("outdirs", nargs=-1, required=True,
+    type=click.Path(file_okay=False, exists=True))
+@click.option("--repeat", type=int, default=3, show_default=True,
+    help="Decode every shard this many times and report the best time")
+def benchshards(outdirs, repeat):
+    """
+    Compare size and decode speed of component shards of builds in OUTDIRS,
+    e.g., builds of the same library in different format versions.
+    """
+    for outdir in outdirs:
+        with open(os.path.join(outdir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        shards = [
+            os.path.join(outdir, name)
+            for name, info in sorted(manifest["files"].items())
+            if info["kind"] == "components"
+        ]
+        compressed = sum(os.path.getsize(x) for x in shards)
+        uncompressed = 0
+        for shard in shards:
+            with gzip.open(shard, "rb") as f:
+                uncompressed += len(f.read())
+        decodeTime = _bestTime(lambda: [readShardRows(x) for x in shards], repeat)
+        components = manifest["totalComponents"]
+        print(f"{outdir} (version {manifest['version']}): {len(shards)} shards, "
+              f"{compressed} B compressed, {uncompressed} B uncompressed, "
+              f"decode {decodeTime:.3f} s ({components / max(decodeTime, 1e-9):.0f} components/s)")
+
+
+def _scanPerCategory(lib, stockNewerThan):
+    count = 0
+    for catName, subcategories in lib.categories().items():
+        for subcatName in subcategories:
+            if lib.countCategoryComponents(catName, subcatName, stockNewerThan) == 0:
+                continue
+            for _ in lib.iterCategoryComponents(catName, subcatName, stockNewerThan):
+                count += 1
+    return count
+
+
+def _scanStreaming(lib, stockNewerThan):
+    count = 0
+    for _ in lib.iterComponentsByCategory(stockNewerThan):
+        count += 1
+    return count
+
+
+@click.command()
+@click.argument("library", type=click.Path(dir_okay=False, exists=True))
+@click.option("--ignoreoldstock", type=int, default=None,
+    help="Ignore components that weren't on stock for more than n days")
+@click.option("--repeat", type=int, default=3, show_default=True,
+    help="Scan the library this many times and report the best time")
+def benchscan(library, ignoreoldstock, repeat):
+    """
+    Compare throughput of reading all components of the LIBRARY by per
+    category queries and by the single streaming scan used by buildtables.
+    """
+    lib = PartLibraryDb(library)
+    try:
+        for name, scan in [("per category", _scanPerCategory), ("streaming", _scanStreaming)]:
+            count = scan(lib, ignoreoldstock)
+            elapsed = _bestTime(lambda: scan(lib, ignoreoldstock), repeat)
+            print(f"{name}: {count} components in {elapsed:.3f} s "
+                  f"({count / max(elapsed, 1e-9):.0f} components/s)")
+    finally:
+        lib.close()
+
+
+_TYPED_RANGE_QUERY = """
+    SELECT component_id FROM component_numeric_attributes
+    WHERE attribute_key_id = ? AND value_name = ? AND numeric_value BETWEEN ? AND ?
+    """
+
+_JSON_CANDIDATES_QUERY = """
+    SELECT a.component_id, t.json, v.value_json
+    FROM component_attributes a
+    JOIN attribute_values v USING(attribute_value_id)
+    LEFT JOIN attribute_templates t USING(attribute_template_id)
+    WHERE a.attribute_key_id = ?
+    """
+
+
+def _jsonRangeQuery(conn, keyId, valueName, low, high):
+    """
+    Answer a range query by decoding the value of every component having the
+    attribute
+    """
+    result = []
+    for componentId, template, values in conn.execute(_JSON_CANDIDATES_QUERY, (keyId,)):
+        value = joinAttributeValue(None if template is None else json.loads(template), json.loads(values))
+        number = value.get("values", {}).get(valueName, [None])[0] if isinstance(value, dict) else None
+        if isinstance(number, (int, float)) and not isinstance(number, bool) and low <= number <= high:
+            result.append(componentId)
+    return result
+
+
+def _rangeQueries(conn, count):
+    """
+    Pick range queries over the most common numeric values: a window of 1 %
+    around the median (e.g., resistance between 9.9k and 10.1k) and all
+    values at least the median (e.g., Vds >= 30 V)
+    """
+    queries = []
+    for keyId, keyName, valueName, unit, n in conn.execute("""
+            SELECT n.attribute_key_id, k.name, n.value_name, n.unit, COUNT(*)
+            FROM component_numeric_attributes n JOIN attribute_keys k USING(attribute_key_id)
+            GROUP BY n.attribute_key_id, n.value_name
+            ORDER BY COUNT(*) DESC LIMIT ?""", (count,)):
+        median = conn.execute("""
+            SELECT numeric_value FROM component_numeric_attributes
+            WHERE attribute_key_id = ? AND value_name = ?
+            ORDER BY numeric_value LIMIT 1 OFFSET ?""", (keyId, valueName, n // 2)).fetchone()[0]
+        low, high = sorted([median * 0.99, median * 1.01])
+        queries.append((f"{keyName}.{valueName} between {low:g} and {high:g} {unit}",
+            keyId, valueName, low, high))
+        queries.append((f"{keyName}.{valueName} >= {median:g} {unit}",
+            keyId, valueName, median, float("inf")))
+    return queries
+
+
+def _queryPlan(conn, query, params):
+    return "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params))
+
+
+@click.command()
+@click.argument("webdb", type=click.Path(dir_okay=False, exists=True))
+@click.option("--queries", type=int, default=5, show_default=True,
+    help="Benchmark range queries over this many most common numeric values")
+@click.option("--repeat", type=int, default=3, show_default=True,
+    help="Run every query this many times and report the best time")
+def benchwebdb(webdb, queries, repeat):
+    """
+    Compare numeric range queries on the WEBDB built by buildwebdb answered
+    by the typed component_numeric_attributes table and by decoding the
+    attribute values of all components having the attribute. Print the query
+    plans to show the index use.
+    """
+    conn = sqlite3.connect(f"file:{webdb}?mode=ro", uri=True)
+    try:
+        for name, keyId, valueName, low, high in _rangeQueries(conn, queries):
+            params = (keyId, valueName, low, high)
+            typed = sorted(x for x, in conn.execute(_TYPED_RANGE_QUERY, params))
+            decoded = sorted(_jsonRangeQuery(conn, *params))
+            if typed != decoded:
+                raise click.ClickException(f"Query {name} gives different results")
+            typedTime = _bestTime(lambda: conn.execute(_TYPED_RANGE_QUERY, params).fetchall(), repeat)
+            jsonTime = _bestTime(lambda: _jsonRangeQuery(conn, *params), repeat)
+            print(f"{name}: {len(typed)} components")
+            print(f"    typed {typedTime * 1000:.2f} ms: {_queryPlan(conn, _TYPED_RANGE_QUERY, params)}")
+            print(f"    json  {jsonTime * 1000:.2f} ms: {_queryPlan(conn, _JSON_CANDIDATES_QUERY, (keyId,))}")
+    finally:
+        conn.close()
+
+
+def _mfrQueries(conn, count):
+    """
+    Pick search strings from MFR numbers spread over the DB: a prefix and a
+    part from the middle of each, e.g., "STM32F1" and "32F10" of
+    STM32F103C8T6. Strings with LIKE wildcards are skipped; an ESCAPE clause
+    would keep the trigram index from being used.
+    """
+    total = conn.execute("SELECT COUNT(*) FROM components").fetchone()[0]
+    step = max(1, total // max(1, count))
+    queries = []
+    for mfr, in conn.execute(
+            "SELECT mfr FROM components WHERE component_id % ? = 0 AND length(mfr) >= 8 LIMIT ?",
+            (step, count)):
+        for kind, text in [("prefix", mfr[:max(4, len(mfr) * 2 // 3)]), ("substring", mfr[2:7])]:
+            if "%" not in text and "_" not in text:
+                queries.append((kind, text))
+    return queries
+
+
+def _indexSize(conn, pattern):
+    return conn.execute(
+        "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name LIKE ?", (pattern,)).fetchone()[0]
+
+
+def _ftsMethods(conn):
+    """
+    Return a dictionary (method name, query kind) -> function of a search
+    string returning the set of matching component ids, for the indexes the
+    DB has. The scan of components is the reference for the others.
+    """
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    like = lambda kind, text: ("" if kind == "prefix" else "%") + text + "%"
+    methods = {}
+    for kind in ["prefix", "substring"]:
+        methods[("scan", kind)] = lambda text, kind=kind: {x for x, in conn.execute(
+            "SELECT component_id FROM components WHERE mfr LIKE ?", (like(kind, text),))}
+    if meta.get("with_fts") == "1" and meta.get("fts_tokenizer", "unicode61") == "unicode61":
+        # Tokens are whole words and phrases need positions, which are not
+        # stored; look up all tokens, the last one as a prefix, and check the
+        # MFR numbers of the candidates
+        def tokenPrefix(text):
+            tokens = re.findall(r"\w+", text)
+            if not tokens:
+                return methods[("scan", "prefix")](text)
+            query = " AND ".join(f'"{x}"' for x in tokens) + "*"
+            return {x for x, in conn.execute(
+                """
+                SELECT c.component_id FROM component_fts f JOIN components c ON c.component_id = f.rowid
+                WHERE component_fts MATCH ? AND c.mfr LIKE ?
+                """, (query, like("prefix", text)))}
+        methods[("fts unicode61", "prefix")] = tokenPrefix
+    if meta.get("with_fts") == "1" and meta.get("fts_tokenizer") == "trigram":
+        for kind in ["prefix", "substring"]:
+            methods[("fts trigram", kind)] = lambda text, kind=kind: {x for x, in conn.execute(
+                "SELECT rowid FROM component_fts WHERE mfr LIKE ?", (like(kind, text),))}
+    if meta.get("mpn_index") == "1":
+        def mpnPrefix(text):
+            prefix = normalizeMpn(text)
+            return {x for x, in conn.execute(
+                """
+                SELECT component_id FROM component_mpns
+                WHERE normalized_mpn >= ? AND normalized_mpn < ?
+                """, (prefix, prefix + "\U0010ffff"))}
+        methods[("mpn index", "prefix")] = mpnPrefix
+    return methods
+
+
+@click.command()
+@click.argument("webdbs", nargs=-1, required=True, type=click.Path(dir_okay=False, exists=True))
+@click.option("--queries", type=int, default=50, show_default=True,
+    help="Number of MFR numbers to derive search strings from")
+@click.option("--repeat", type=int, default=3, show_default=True,
+    help="Run every query this many times and report the best time")
+def benchfts(webdbs, queries, repeat):
+    """
+    Compare prefix and substring searches for MFR numbers in WEBDBS built by
+    buildwebdb with different --fts-tokenizer and --mpn-index options.
+    Report index sizes, the mean latency of every method and how many
+    components it finds compared to a scan of all MFR numbers; the MPN index
+    compares normalized numbers, so it finds also numbers differing in
+    punctuation.
+    """
+    with sqlite3.connect(f"file:{webdbs[0]}?mode=ro", uri=True) as conn:
+        searches = _mfrQueries(conn, queries)
+    for webdb in webdbs:
+        conn = sqlite3.connect(f"file:{webdb}?mode=ro", uri=True)
+        try:
+            print(f"{webdb}: {os.path.getsize(webdb)} B, "
+                  f"FTS index {_indexSize(conn, 'component_fts%')} B, "
+                  f"MPN index {_indexSize(conn, 'component_mpns%')} B")
+            methods = _ftsMethods(conn)
+            for (name, kind), method in methods.items():
+                texts = [text for searchKind, text in searches if searchKind == kind]
+                reference = methods[("scan", kind)]
+                found = expected = 0
+                for text in texts:
+                    found += len(method(text))
+                    expected += len(reference(text))
+                elapsed = sum(_bestTime(lambda: method(text), repeat) for text in texts)
+                print(f"    {name} {kind}: {elapsed / max(1, len(texts)) * 1000:.2f} ms per query, "
+                      f"{found} found, {expected} by scan")
+        finally:
+            conn.close()
+
+
+def _readBytes():
+    """
+    Return the number of bytes this process has read from files so far
+    """
+    with open("/proc/self/io", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+    raise RuntimeError("No rchar in /proc/self/io")
+
+
+def _profileQueries(conn):
+    """
+    Return typical queries of the frontend as (name, SQL, parameters) with
+    parameters picked from the DB: the largest category, its most common
+    attribute, a component from the middle of it, etc.
+    """
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    categoryId, = conn.execute("""
+        SELECT category_id FROM components GROUP BY category_id
+        ORDER BY COUNT(*) DESC LIMIT 1""").fetchone()
+    componentId, lcsc = conn.execute("""
+        SELECT component_id, lcsc FROM components WHERE category_id = ?
+        ORDER BY component_id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM components WHERE category_id = ?)
+        """, (categoryId, categoryId)).fetchone()
+    keyId, valueId = conn.execute("""
+        SELECT attribute_key_id, attribute_value_id FROM component_attributes WHERE component_id = ?
+        ORDER BY attribute_key_id LIMIT 1""", (componentId,)).fetchone()
+    manufacturerId, = conn.execute(
+        "SELECT manufacturer_id FROM components WHERE component_id = ?", (componentId,)).fetchone()
+    queries = [
+        ("component by LCSC", """
+            SELECT * FROM components c JOIN component_details d USING(component_id)
+            WHERE c.lcsc = ?""", (lcsc,)),
+        ("component attributes", """
+            SELECT k.name, v.attribute_template_id, v.value_json
+            FROM component_attributes a
+            JOIN attribute_keys k USING(attribute_key_id)
+            JOIN attribute_values v USING(attribute_value_id)
+            WHERE a.component_id = ?""", (componentId,)),
+        ("category page", """
+            SELECT component_id, lcsc, mfr, stock, price_at_moq FROM components
+            WHERE category_id = ? ORDER BY component_id LIMIT 100""", (categoryId,)),
+        ("category page details", """
+            SELECT d.component_id, d.description, d.img
+            FROM components c JOIN component_details d USING(component_id)
+            WHERE c.category_id = ? ORDER BY c.component_id LIMIT 100""", (categoryId,)),
+        ("category by price", """
+            SELECT lcsc, price_at_moq FROM components
+            WHERE category_id = ? AND price_at_moq IS NOT NULL AND stock > 0
+            ORDER BY price_at_moq LIMIT 100""", (categoryId,)),
+        ("category in stock count",
+            "SELECT COUNT(*) FROM components WHERE category_id = ? AND stock > 0", (categoryId,)),
+        ("manufacturer in category",
+            "SELECT lcsc FROM components WHERE manufacturer_id = ? AND category_id = ?",
+            (manufacturerId, categoryId)),
+        ("attribute facet", """
+            SELECT a.attribute_value_id, COUNT(*)
+            FROM components c JOIN component_attributes a USING(component_id)
+            WHERE c.category_id = ? AND a.attribute_key_id = ?
+            GROUP BY a.attribute_value_id""", (categoryId, keyId)),
+        ("attribute value filter", """
+            SELECT c.lcsc
+            FROM component_attributes a JOIN components c USING(component_id)
+            WHERE a.attribute_key_id = ? AND a.attribute_value_id = ? AND c.category_id = ?""",
+            (keyId, valueId, categoryId)),
+        ("price at quantity", PRICES_AT_QUANTITY_QUERY, {"category_id": categoryId, "quantity": 100}),
+    ]
+    rangeQueries = _rangeQueries(conn, 1)
+    if rangeQueries:
+        _, rangeKeyId, valueName, low, high = rangeQueries[0]
+        queries.append(("numeric range", _TYPED_RANGE_QUERY, (rangeKeyId, valueName, low, high)))
+    if meta.get("with_fts") == "1":
+        mfr, = conn.execute("SELECT mfr FROM components WHERE component_id = ?", (componentId,)).fetchone()
+        if meta.get("fts_tokenizer") == "trigram":
+            queries.append(("full text", "SELECT rowid FROM component_fts WHERE mfr LIKE ?",
+                (f"%{mfr[1:-1]}%",)))
+        else:
+            # Phrases need positions, which are not stored
+            queries.append(("full text", "SELECT rowid FROM component_fts WHERE component_fts MATCH ?",
+                (" AND ".join(f'"{x}"' for x in re.findall(r"\w+", mfr)),)))
+    return queries
+
+
+def _profileQuery(webdb, sql, params):
+    """
+    Run a query on a fresh connection, so nothing is cached, and return its
+    rows and the number of bytes read from the DB. Memory mapping is off, so
+    every page is read by a syscall counted in /proc/self/io.
+    """
+    conn = sqlite3.connect(f"file:{webdb}?mode=ro", uri=True)
+    try:
+        conn.execute("PRAGMA mmap_size = 0")
+        # Load the schema first
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        # Reading /proc/self/io is counted as well
+        overhead = -_readBytes() + _readBytes()
+        before = _readBytes()
+        rows = conn.execute(sql, params).fetchall()
+        touched = _readBytes() - before - overhead
+    finally:
+        conn.close()
+    return rows, touched
+
+
+@click.command()
+@click.argument("webdb", type=click.Path(dir_okay=False, exists=True))
+@click.option("--sql", "extraQueries", multiple=True,
+    help="An additional query to profile, may be given multiple times")
+def webdbprofile(webdb, extraQueries):
+    """
+    Replay typical queries on the WEBDB built by buildwebdb from a cold cache
+    and report pages read, bytes touched and the query plan of each. A remote
+    reader fetching pages by HTTP range requests pays for every page, so this
+    compares page sizes, layouts and indexes. Linux only.
+    """
+    if not os.path.exists("/proc/self/io"):
+        raise click.ClickException("Profiling requires /proc/self/io")
+    with sqlite3.connect(f"file:{webdb}?mode=ro", uri=True) as conn:
+        pageSize, = conn.execute("PRAGMA page_size").fetchone()
+        queries = _profileQueries(conn)
+        queries += [(f"custom {i + 1}", sql, ()) for i, sql in enumerate(extraQueries)]
+        plans = [_queryPlan(conn, sql, params) for _, sql, params in queries]
+    print(f"{webdb}: {os.path.getsize(webdb)} B, page size {pageSize} B")
+    totalPages = totalBytes = 0
+    for (name, sql, params), plan in zip(queries, plans):
+        rows, touched = _profileQuery(webdb, sql, params)
+        # Besides pages, SQLite reads a few bytes of the header per transaction
+        pages = touched // pageSize
+        totalPages += pages
+        totalBytes += touched
+        print(f"{name}: {len(rows)} rows, {pages} pages, {touched} B")
+        print(f"    {plan}")
+    print(f"total: {totalPages} pages, {totalBytes} B")
@@ -0,0 +1,251 @@
+"""
+Columnar binary encoding of component shards (frontend format version 3).
+
+A table is stored column by column so a client can decode only the columns it
+filters on. All integers are unsigned LEB128 varints unless stated otherwise.
+
+    magic "JLCC", u8 format revision
+    varint row count, varint column count
+    for each column:
+        varint name length, name (UTF-8)
+        u8 encoding
+        varint payload length, payload
+
+Column encodings:
+
+- STRING_DICT: varint dictionary size, dictionary strings (varint length +
+  UTF-8) in the order of first occurrence, then one varint per row: 0 for
+  null, i + 1 for the i-th dictionary string.
+- LCSC_DELTA: LCSC codes ("C" + number) stored as zigzag varint deltas of
+  their numbers. Rows sorted by LCSC thus take a byte or two each.
+- INT: one zigzag varint + 1 per row, 0 for null.
+- INT_LISTS: per row a varint count followed by the varints.
+- PRICE_TIERS: per row a varint tier count, then per tier varint qFrom,
+  varint qTo + 1 (0 for unbounded) and the price as a little-endian float64.
+"""
+
+import struct
+
+MAGIC = b"JLCC"
+REVISION = 1
+
+STRING_DICT = 1
+LCSC_DELTA = 2
+INT = 3
+INT_LISTS = 4
+PRICE_TIERS = 5
+
+_DOUBLE = struct.Struct("<d")
+
+
+def _writeVarint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if value & 1 == 0 else -((value + 1) >> 1)
+
+
+class _Reader:
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def varint(self):
+        data = self.data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[self.offset]
+            self.offset += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def bytes(self, length):
+        start = self.offset
+        self.offset += length
+        return self.data[start:self.offset]
+
+    def string(self):
+        return self.bytes(self.varint()).decode("utf-8")
+
+    def double(self):
+        value = _DOUBLE.unpack_from(self.data, self.offset)[0]
+        self.offset += _DOUBLE.size
+        return value
+
+
+def _encodeStringDict(values):
+    dictionary = {}
+    indices = bytearray()
+    for value in values:
+        if value is None:
+            _writeVarint(indices, 0)
+            continue
+        idx = dictionary.setdefault(value, len(dictionary))
+        _writeVarint(indices, idx + 1)
+    out = bytearray()
+    _writeVarint(out, len(dictionary))
+    for value in dictionary:
+        encoded = value.encode("utf-8")
+        _writeVarint(out, len(encoded))
+        out += encoded
+    return out + indices
+
+
+def _decodeStringDict(reader, rowCount):
+    dictionary = [None] + [reader.string() for _ in range(reader.varint())]
+    return [dictionary[reader.varint()] for _ in range(rowCount)]
+
+
+def _encodeLcscDelta(values):
+    out = bytearray()
+    previous = 0
+    for value in values:
+        number = int(value[1:])
+        _writeVarint(out, _zigzag(number - previous))
+        previous = number
+    return out
+
+
+def _decodeLcscDelta(reader, rowCount):
+    values = []
+    number = 0
+    for _ in range(rowCount):
+        number += _unzigzag(reader.varint())
+        values.append(f"C{number}")
+    return values
+
+
+def _encodeInt(values):
+    out = bytearray()
+    for value in values:
+        _writeVarint(out, 0 if value is None else _zigzag(value) + 1)
+    return out
+
+
+def _decodeInt(reader, rowCount):
+    values = []
+    for _ in range(rowCount):
+        value = reader.varint()
+        values.append(None if value == 0 else _unzigzag(value - 1))
+    return values
+
+
+def _encodeIntLists(values):
+    out = bytearray()
+    for value in values:
+        _writeVarint(out, len(value))
+        for item in value:
+            _writeVarint(out, item)
+    return out
+
+
+def _decodeIntLists(reader, rowCount):
+    return [[reader.varint() for _ in range(reader.varint())] for _ in range(rowCount)]
+
+
+def _encodePriceTiers(values):
+    out = bytearray()
+    for tiers in values:
+        _writeVarint(out, len(tiers))
+        for qFrom, qTo, price in tiers:
+            _writeVarint(out, qFrom)
+            _writeVarint(out, 0 if qTo is None else qTo + 1)
+            out += _DOUBLE.pack(price)
+    return out
+
+
+def _decodePriceTiers(reader, rowCount):
+    values = []
+    for _ in range(rowCount):
+        tiers = []
+        for _ in range(reader.varint()):
+            qFrom = reader.varint()
+            qTo = reader.varint()
+            tiers.append([qFrom, None if qTo == 0 else qTo - 1, reader.double()])
+        values.append(tiers)
+    return values
+
+
+_ENCODERS = {
+    STRING_DICT: _encodeStringDict,
+    LCSC_DELTA: _encodeLcscDelta,
+    INT: _encodeInt,
+    INT_LISTS: _encodeIntLists,
+    PRICE_TIERS: _encodePriceTiers,
+}
+
+_DECODERS = {
+    STRING_DICT: _decodeStringDict,
+    LCSC_DELTA: _decodeLcscDelta,
+    INT: _decodeInt,
+    INT_LISTS: _decodeIntLists,
+    PRICE_TIERS: _decodePriceTiers,
+}
+
+
+def encodeTable(columns, rowCount):
+    """
+    Encode a table given as a list of (name, encoding, values) columns
+    """
+    out = bytearray(MAGIC)
+    out.append(REVISION)
+    _writeVarint(out, rowCount)
+    _writeVarint(out, len(columns))
+    for name, encoding, values in columns:
+        if len(values) != rowCount:
+            raise ValueError(f"Column {name} has {len(values)} rows instead of {rowCount}")
+        encodedName = name.encode("utf-8")
+        _writeVarint(out, len(encodedName))
+        out += encodedName
+        out.append(encoding)
+        payload = _ENCODERS[encoding](values)
+        _writeVarint(out, len(payload))
+        out += payload
+    return bytes(out)
+
+
+def decodeTable(data, columns=None):
+    """
+    Decode a table into a dictionary column name -> list of values. If a list
+    of column names is given, other columns are skipped without decoding.
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a columnar table")
+    if data[len(MAGIC)] != REVISION:
+        raise ValueError(f"Unsupported columnar table revision {data[len(MAGIC)]}")
+    reader = _Reader(data, len(MAGIC) + 1)
+    rowCount = reader.varint()
+    result = {}
+    for _ in range(reader.varint()):
+        name = reader.string()
+        encoding = reader.bytes(1)[0]
+        length = reader.varint()
+        end = reader.offset + length
+        if columns is None or name in columns:
+            result[name] = _DECODERS[encoding](reader, rowCount)
+            if reader.offset != end:
+                raise ValueError(f"Corrupted column {name}")
+        reader.offset = end
+    return result
+
+
+def tableRows(table, schema):
+    """
+    Turn a decoded table into rows laid out according to the schema, i.e., a
+    dictionary column name -> index in the row
+    """
+    columns = [None] * len(schema)
+    for name, idx in schema.items():
+        columns[idx] = table[name]
+    return [list(row) for row in zip(*columns)]
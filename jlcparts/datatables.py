@@ -1,16 +1,26 @@
+import bisect
 import hashlib
+import itertools
 import re
 import os
 import shutil
 import json
+import math
 import datetime
 import gzip
+import tempfile
+import zlib
 from pathlib import Path
 
 import click
 from jlcparts.partLib import PartLibraryDb
 from jlcparts.common import sha256file
-from jlcparts import attributes, descriptionAttributes
+from jlcparts import attributes, columnar, descriptionAttributes
+from jlcparts.artifacts import ArtifactWriter, parseCodecs
+from jlcparts.diskdict import CACHE_SIZE_DEFAULT, DiskDict
+from jlcparts.searchindex import (MPN_PARTITIONS_DEFAULT, SEARCH_PARTITIONS_DEFAULT,
+                                  MpnIndexBuilder, SearchIndexBuilder,
+                                  mpnPartitionName, partitionName)
 
 def saveJson(object, filename, hash=False, pretty=False, compress=False):
     openFn = gzip.open if compress else open
@@ -342,7 +352,104 @@ def buildDatatable(components):
     }
 
 def buildStocktable(components):
-    return {component["lcsc"]: component["stock"] for component in components }
+    """
+    Return the frequently changing columns of components - stock and price
+    tiers as [qFrom, qTo, price] triplets - as arrays aligned with components
+    """
+    return {
+        "stock": [component["stock"] for component in components],
+        "price": [
+            [[tier["qFrom"], tier["qTo"], tier["price"]] for tier in component["price"]]
+            for component in components
+        ],
+    }
+
+ROW_ORDERS = ["price", "stock", "joints"]
+PRESORTED_ROWS_DEFAULT = 1000
+
+
+def _priceAtMoq(component):
+    """
+    Return the unit price at the minimum order quantity, i.e., the price of
+    the first tier, so parts not sold by a single piece are priced too. None
+    if the component has no price.
+    """
+    tiers = component["price"]
+    if not tiers:
+        return None
+    return min(tiers, key=lambda tier: tier["qFrom"])["price"]
+
+
+def _rowOrderKeys(component):
+    """
+    Return sort keys of a component for all row orders. Components in stock go
+    first in all orders, the cheapest at the minimum order quantity first in
+    price order, the largest stock first in stock order and the fewest joints
+    first in joints order. Ties are broken by LCSC code.
+    """
+    lcsc = int(component["lcsc"][1:])
+    outOfStock = component["stock"] <= 0
+    price = _priceAtMoq(component)
+    joints = component.get("joints")
+    return {
+        "price": (outOfStock, price is None, price or 0, lcsc),
+        "stock": (outOfStock, -component["stock"], lcsc),
+        "joints": (outOfStock, joints is None, joints or 0, lcsc),
+    }
+
+
+class _RowOrders:
+    """
+    Collects rows of a category and gives the row indices of every order;
+    only the first limit rows unless limit is 0. With a limit, only twice as
+    many sort keys as the limit are held in memory regardless of the category
+    size. Rows sorting after the last kept row are dropped right away.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.rowCount = 0
+        self.keys = {order: [] for order in ROW_ORDERS}
+        self.cutoffs = {}
+
+    def add(self, component):
+        for order, key in _rowOrderKeys(component).items():
+            item = (key, self.rowCount)
+            cutoff = self.cutoffs.get(order)
+            if cutoff is not None and item > cutoff:
+                continue
+            keys = self.keys[order]
+            keys.append(item)
+            if self.limit > 0 and len(keys) >= 2 * self.limit:
+                keys.sort()
+                del keys[self.limit:]
+                self.cutoffs[order] = keys[-1]
+        self.rowCount += 1
+
+    def orders(self):
+        orders = {}
+        for order, keys in self.keys.items():
+            keys.sort()
+            if self.limit > 0:
+                del keys[self.limit:]
+            orders[order] = [row for _, row in keys]
+        return orders
+
+
+def resolveRowOrder(orderTable, order, limit=None):
+    """
+    Resolve a presorted row order of a category into a list of (shard name,
+    row index within the shard) pairs; only the first limit rows if given
+    """
+    rows = orderTable["orders"][order]
+    if limit is not None:
+        rows = rows[:limit]
+    offsets = orderTable["shardOffsets"]
+    result = []
+    for row in rows:
+        shardIdx = bisect.bisect_right(offsets, row) - 1
+        result.append((orderTable["shards"][shardIdx], row - offsets[shardIdx]))
+    return result
+
 
 def clearDir(directory):
     """
@@ -357,20 +464,27 @@ def clearDir(directory):
 
 
 WEB_FILE_FORMAT_VERSION = 2
+# Version 3 stores shards, stock and price tables in the columnar binary
+# encoding (see jlcparts.columnar) instead of JSON. The web frontend reads
+# version 2 only.
+WEB_FILE_FORMAT_VERSIONS = [2, 3]
 LOOKUP_BUCKET_SIZE_DEFAULT = 100000
 MAX_COMPONENTS_PER_SHARD_DEFAULT = 20000
+SHARD_BOUNDARIES = ["content", "fixed"]
+LUT_MODES = ["global", "category"]
+# Stock and price change between almost every build, so they are not part of
+# the shards. They are stored in per-category stock and price tables instead,
+# see buildStocktable.
 COMPONENT_ROW_SCHEMA = {
     "lcsc": 0,
     "mfr": 1,
     "joints": 2,
     "description": 3,
     "datasheet": 4,
-    "price": 5,
-    "img": 6,
-    "url": 7,
-    "attributes": 8,
-    "stock": 9,
-    "subcategory": 10,
+    "img": 5,
+    "url": 6,
+    "attributes": 7,
+    "subcategory": 8,
 }
 COMPONENT_SOURCE_SCHEMA = [
     "lcsc",
@@ -378,11 +492,38 @@ COMPONENT_SOURCE_SCHEMA = [
     "joints",
     "description",
     "datasheet",
-    "price",
     "img",
     "url",
     "attributes",
-    "stock",
+]
+COLUMNAR_SHARD_ENCODINGS = {
+    "lcsc": columnar.LCSC_DELTA,
+    "mfr": columnar.STRING_DICT,
+    "joints": columnar.INT,
+    "description": columnar.STRING_DICT,
+    "datasheet": columnar.STRING_DICT,
+    "img": columnar.STRING_DICT,
+    "url": columnar.STRING_DICT,
+    "attributes": columnar.INT_LISTS,
+    "subcategory": columnar.INT,
+}
+COLUMNAR_HOT_ENCODINGS = {
+    "stock": columnar.INT,
+    "price": columnar.PRICE_TIERS,
+}
+# Library fields the content of a frontend shard is derived from
+COMPONENT_FINGERPRINT_FIELDS = [
+    "lcsc",
+    "mfr",
+    "package",
+    "joints",
+    "manufacturer",
+    "basic",
+    "preferred",
+    "description",
+    "datasheet",
+    "extra",
+    "jlc_extra",
 ]
 
 
@@ -394,210 +535,990 @@ def _stableComponentFilebase(catName, subcatName):
     return f"{base}__{digest}".lower()
 
 
-def _writeJsonArtifact(data, filename, compress=False):
+
+
+def _jsonArtifactPayload(data):
+    """
+    Serialize data canonically, so equal data always give equal bytes.
+    """
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def _jsonLinesArtifactPayload(rows):
+    return b"".join(_jsonArtifactPayload(row) + b"\n" for row in rows)
+
+
+def _readArtifactPayload(filename, compress=False):
     openFn = gzip.open if compress else open
-    with openFn(filename, "wt", encoding="utf-8") as f:
-        json.dump(data, f, separators=(",", ":"), sort_keys=True)
-    return sha256file(filename)
+    with openFn(filename, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def _writeJsonArtifact(data, filename):
+    payload = _jsonArtifactPayload(data)
+    with open(filename, "wb") as f:
+        f.write(payload)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _manifestContentHash(manifest):
+    """
+    Hash of the manifest without its creation time. Two builds of the same
+    data have the same content hash.
+    """
+    content = {k: v for k, v in manifest.items() if k not in ["created", "contentHash"]}
+    return hashlib.sha256(_jsonArtifactPayload(content)).hexdigest()
 
 
-def _writeJsonLinesArtifact(rows, filename):
-    with gzip.open(filename, "wt", encoding="utf-8") as f:
-        for row in rows:
-            json.dump(row, f, separators=(",", ":"), sort_keys=False)
-            f.write("\n")
-    return sha256file(filename)
+def compareBuilds(outdirA, outdirB):
+    """
+    Compare two build outputs byte for byte and return a list of differences.
+    The manifests are compared without their creation time.
+    """
+    differences = []
+    namesA = set(os.listdir(outdirA))
+    namesB = set(os.listdir(outdirB))
+    for name in sorted(namesA ^ namesB):
+        differences.append(f"{name} is present only in {outdirA if name in namesA else outdirB}")
+    for name in sorted(namesA & namesB):
+        if name == "manifest.json":
+            manifestA = _loadManifest(os.path.join(outdirA, name))
+            manifestB = _loadManifest(os.path.join(outdirB, name))
+            manifestA.pop("created", None)
+            manifestB.pop("created", None)
+            if manifestA != manifestB:
+                differences.append(f"{name} differs")
+        elif Path(outdirA, name).read_bytes() != Path(outdirB, name).read_bytes():
+            differences.append(f"{name} differs")
+    return differences
 
 
-def _lookupBucketForLcsc(lcsc, bucketSize):
-    return int(lcsc[1:]) // bucketSize
+def _lcscIndex(mapping):
+    """
+    Encode a mapping LCSC -> shard name of a lookup bucket as ranges. Sorted
+    LCSC numbers mapping to the same shard form a range; a range is given by
+    its first number (delta-encoded against the previous range) and an index
+    to the table of shard names. Numbers between ranges are not stored, a
+    lookup thus yields the only shard that can contain the component.
+
+    The gain depends on how much LCSC codes of categories interleave; the
+    index is roughly 4 to 8 times smaller than a per-code map.
+    """
+    shards = sorted(set(mapping.values()))
+    shardIndex = {name: i for i, name in enumerate(shards)}
+    starts = []
+    indices = []
+    previousStart = 0
+    for number, name in sorted((int(lcsc[1:]), name) for lcsc, name in mapping.items()):
+        if indices and indices[-1] == shardIndex[name]:
+            continue
+        starts.append(number - previousStart)
+        indices.append(shardIndex[name])
+        previousStart = number
+    return {"shards": shards, "starts": starts, "shardIndices": indices}
+
+
+class LcscIndex:
+    """
+    Decoded LCSC index of a lookup bucket, answers which shard can contain a
+    component.
+    """
+    def __init__(self, data):
+        self.starts = []
+        number = 0
+        for delta in data["starts"]:
+            number += delta
+            self.starts.append(number)
+        self.rangeShards = [data["shards"][i] for i in data["shardIndices"]]
+
+    def shardFor(self, lcsc):
+        i = bisect.bisect_right(self.starts, int(lcsc[1:])) - 1
+        return self.rangeShards[i] if i >= 0 else None
 
 
 def _isUsableCategory(catName, subcatName):
     return catName.strip() != "" and subcatName.strip() != ""
 
 
-def _componentRows(components, subcategoryId, attributeLut):
+def _componentRows(components, subcategoryId, attributeLut, summary=None):
+    """
+    Turn components into shard rows, the first row being the schema. If a
+    summary dictionary is given, it is filled with facet counts (attribute LUT
+    id -> number of components) and ranges of numeric attribute values
+    (attribute name -> quantity -> [min, max]) of the components.
+    """
     rows = [COMPONENT_ROW_SCHEMA]
+    if summary is not None:
+        facets = summary.setdefault("facets", {})
+        ranges = summary.setdefault("ranges", {})
     for component in components:
-        values = extractComponent(component, COMPONENT_SOURCE_SCHEMA)
-        attrIds = [
-            updateLut(attributeLut, [name, value])
-            for name, value in values[COMPONENT_ROW_SCHEMA["attributes"]].items()
-        ]
-        rows.append([
-            values[COMPONENT_ROW_SCHEMA["lcsc"]],
-            values[COMPONENT_ROW_SCHEMA["mfr"]],
-            values[COMPONENT_ROW_SCHEMA["joints"]],
-            values[COMPONENT_ROW_SCHEMA["description"]],
-            values[COMPONENT_ROW_SCHEMA["datasheet"]],
-            values[COMPONENT_ROW_SCHEMA["price"]],
-            values[COMPONENT_ROW_SCHEMA["img"]],
-            values[COMPONENT_ROW_SCHEMA["url"]],
-            attrIds,
-            values[COMPONENT_ROW_SCHEMA["stock"]],
-            subcategoryId,
-        ])
+        values = dict(zip(COMPONENT_SOURCE_SCHEMA,
+                          extractComponent(component, COMPONENT_SOURCE_SCHEMA)))
+        attributeIds = []
+        for name, value in values["attributes"].items():
+            attributeId = updateLut(attributeLut, [name, value])
+            attributeIds.append(attributeId)
+            if summary is None:
+                continue
+            facets[str(attributeId)] = facets.get(str(attributeId), 0) + 1
+            for quantity, (number, _) in _attributeQuantities(value):
+                if isinstance(number, bool) or not isinstance(number, (int, float)) \
+                        or not math.isfinite(number):
+                    continue
+                valueRange = ranges.setdefault(name, {}).setdefault(quantity, [number, number])
+                valueRange[0] = min(valueRange[0], number)
+                valueRange[1] = max(valueRange[1], number)
+        values["attributes"] = attributeIds
+        values["subcategory"] = subcategoryId
+        row = [None] * len(COMPONENT_ROW_SCHEMA)
+        for name, idx in COMPONENT_ROW_SCHEMA.items():
+            row[idx] = values[name]
+        rows.append(row)
     return rows
 
 
-def _flushComponentShard(chunk, shardName, outdir, subcategoryId, attributeLut,
-                         files, lookupBuckets, lookupBucketSize):
-    shardRows = _componentRows(chunk, subcategoryId, attributeLut)
-    shardPath = os.path.join(outdir, shardName)
-    shardHash = _writeJsonLinesArtifact(shardRows, shardPath)
-    files[shardName] = {
-        "name": shardName,
-        "kind": "components",
-        "sha256": shardHash,
-        "componentCount": len(chunk),
-        "subcategoryId": subcategoryId,
-    }
+def _attributeQuantities(value):
+    if not isinstance(value, dict) or not isinstance(value.get("values"), dict):
+        return []
+    return [(quantity, item) for quantity, item in value["values"].items()
+            if isinstance(item, (list, tuple)) and len(item) == 2]
+
+
+def _mergeSummaries(summaries):
+    """
+    Merge facet counts and value ranges of several shard summaries
+    """
+    facets = {}
+    ranges = {}
+    for summary in summaries:
+        for attributeId, count in summary["facets"].items():
+            facets[attributeId] = facets.get(attributeId, 0) + count
+        for name, quantities in summary["ranges"].items():
+            for quantity, (low, high) in quantities.items():
+                valueRange = ranges.setdefault(name, {}).setdefault(quantity, [low, high])
+                valueRange[0] = min(valueRange[0], low)
+                valueRange[1] = max(valueRange[1], high)
+    return {"facets": facets, "ranges": ranges}
+
+
+def _columnarShard(rows):
+    """
+    Encode shard rows (the first one being the schema) as a columnar table
+    """
+    schema, rows = rows[0], rows[1:]
+    return columnar.encodeTable([
+        (name, COLUMNAR_SHARD_ENCODINGS[name], [row[idx] for row in rows])
+        for name, idx in sorted(schema.items(), key=lambda x: x[1])
+    ], len(rows))
+
+
+def _columnarHotTable(column, table):
+    """
+    Encode a stock or price table as a columnar table with a row per component
+    and a column naming the shard of the component
+    """
+    shards = [
+        shardName
+        for shardName, values in zip(table["shards"], table[column])
+        for _ in values
+    ]
+    values = [value for shardValues in table[column] for value in shardValues]
+    return columnar.encodeTable([
+        ("shard", columnar.STRING_DICT, shards),
+        (column, COLUMNAR_HOT_ENCODINGS[column], values),
+    ], len(values))
+
+
+def readShardRows(filename):
+    """
+    Read a component shard of any format version and return its rows. The
+    first row is the schema.
+    """
+    if filename.endswith(".col.gz"):
+        with gzip.open(filename, "rb") as f:
+            table = columnar.decodeTable(f.read())
+        return [COMPONENT_ROW_SCHEMA] + columnar.tableRows(table, COMPONENT_ROW_SCHEMA)
+    return [json.loads(line) for line in _readArtifactPayload(filename, compress=True).splitlines()]
+
+
+def _builderSalt(*settings):
+    """
+    Return a fingerprint of the code and settings producing the shard content.
+    Shards built by a different version of the attribute normalization are
+    never reused.
+    """
+    h = hashlib.sha256(json.dumps(settings).encode("utf-8"))
+    for filename in [attributes.__file__, descriptionAttributes.__file__,
+                     columnar.__file__, __file__]:
+        h.update(Path(filename).read_bytes())
+    return h.hexdigest()
+
+
+def _shardFingerprint(chunk, subcategoryId, salt):
+    """
+    Compute a fingerprint of the source rows of a shard. Two shards with the
+    same fingerprint have the same content.
+    """
+    h = hashlib.sha256(f"{salt}:{subcategoryId}\n".encode("utf-8"))
     for component in chunk:
-        bucket = _lookupBucketForLcsc(component["lcsc"], lookupBucketSize)
-        lookupBuckets.setdefault(bucket, {})[component["lcsc"]] = shardName
+        item = [component.get(field) for field in COMPONENT_FINGERPRINT_FIELDS]
+        h.update(json.dumps(item, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def _loadManifest(filename):
+    try:
+        return json.loads(_readArtifactPayload(filename))
+    except (OSError, ValueError):
+        return None
+
+
+def _lutScope(categoryKey=None):
+    """
+    Scope of persisted attribute ids; either the global LUT or a LUT of a
+    single category
+    """
+    return "attributes" if categoryKey is None else f"attributes:{categoryKey}"
+
+
+def _loadPreviousBuild(outdir, formatVersion):
+    """
+    Load the manifest and the attribute LUTs (as a dictionary scope -> LUT
+    entries) of a previous build stored in OUTDIR. Return None if there is no
+    build we can reuse.
+    """
+    try:
+        manifest = _loadManifest(os.path.join(outdir, "manifest.json"))
+        if manifest is None or manifest.get("version") != formatVersion:
+            return None
+        lutFiles = {}
+        if manifest.get("attributesLut"):
+            lutFiles[_lutScope()] = manifest["attributesLut"]
+        for entry in manifest["categories"]:
+            if entry.get("attributesLut"):
+                categoryKey = _stableComponentFilebase(entry["category"], entry["subcategory"])
+                lutFiles[_lutScope(categoryKey)] = entry["attributesLut"]
+        luts = {
+            scope: _lutEntriesFromPayload(
+                json.loads(_readArtifactPayload(os.path.join(outdir, name), compress=True)))
+            for scope, name in lutFiles.items()
+        }
+    except (OSError, EOFError, ValueError, KeyError):
+        return None
+    return manifest, luts
+
+
+def _loadShardSummaries(outdir, summaryName):
+    """
+    Load facet counts and value ranges of shards from a category summary of a
+    previous build. Return a dictionary shard name -> summary, empty if the
+    summary cannot be read.
+    """
+    try:
+        summary = json.loads(_readArtifactPayload(os.path.join(outdir, summaryName), compress=True))
+    except (OSError, EOFError, ValueError):
+        return {}
+    return {
+        shard["name"]: {"facets": shard["facets"], "ranges": shard["ranges"]}
+        for shard in summary["shards"]
+    }
 
 
-def _lutToEntries(lutMap):
-    entries = [None] * len(lutMap)
-    for key, value in lutMap.items():
-        entries[value] = json.loads(key)
-    return entries
+def _lutKey(item):
+    return json.dumps(item, separators=(",", ":"), sort_keys=True)
+
+
+def _lutEntries(lutMap, cacheSize=CACHE_SIZE_DEFAULT):
+    """
+    Yield [name, value] entries of a LUT mapping entry keys to ids in the
+    order of ids. The entries are reordered on the disk, so only cacheSize of
+    them are held in memory.
+    """
+    byId = DiskDict(((id, key) for key, id in lutMap.items()), cacheSize)
+    try:
+        for _, key in byId.items():
+            yield json.loads(key)
+    finally:
+        byId.close()
+
+
+def splitAttributeValue(value):
+    """
+    Split a normalized attribute value into a template - the value without
+    the numbers and strings of its values, e.g., {"format": "${resistance}",
+    "primary": "resistance", "values": [["resistance", "resistance"]]} - and
+    the list of those, e.g., [10000.0]. Values are ordered by their names.
+    Return (None, value) if the value doesn't fit a template.
+    """
+    quantities = _attributeQuantities(value)
+    if not quantities or len(quantities) != len(value["values"]):
+        return None, value
+    quantities.sort(key=lambda item: item[0])
+    template = {key: x for key, x in value.items() if key != "values"}
+    template["values"] = [[quantity, unit] for quantity, (_, unit) in quantities]
+    return template, [number for _, (number, _) in quantities]
+
+
+def joinAttributeValue(template, values):
+    """
+    Inverse of splitAttributeValue
+    """
+    if template is None:
+        return values
+    value = {key: x for key, x in template.items() if key != "values"}
+    value["values"] = {
+        quantity: [number, unit] for (quantity, unit), number in zip(template["values"], values)
+    }
+    return value
+
+
+def _lutPayload(lutMap, cacheSize=CACHE_SIZE_DEFAULT):
+    """
+    Encode an attribute LUT as {"templates": [...], "entries": [[name,
+    template index or null, values], ...]}, so the format and units shared
+    by many values are stored once. Return the payload as it would be given
+    by _jsonArtifactPayload; it is serialized entry by entry, so the LUT is
+    never decoded as a whole.
+    """
+    templates = {}
+    # Keys are sorted in artifacts, entries go first
+    payload = bytearray(b'{"entries":[')
+    for i, (name, value) in enumerate(_lutEntries(lutMap, cacheSize)):
+        template, values = splitAttributeValue(value)
+        if template is not None:
+            template = templates.setdefault(_lutKey(template), len(templates))
+        if i > 0:
+            payload += b","
+        payload += _jsonArtifactPayload([name, template, values])
+    payload += b'],"templates":[' + ",".join(templates).encode("utf-8") + b"]}"
+    return bytes(payload)
+
+
+def _lutEntriesFromPayload(payload):
+    """
+    Decode an attribute LUT file into a list of [name, value] entries
+    """
+    if isinstance(payload, list):
+        # Written before templates were introduced
+        return payload
+    templates = payload["templates"]
+    return [
+        [name, joinAttributeValue(None if template is None else templates[template], values)]
+        for name, template, values in payload["entries"]
+    ]
+
+
+def _lutItems(entries):
+    return ((_lutKey(entry), i) for i, entry in enumerate(entries))
 
 
 def updateLut(lutMap, item):
-    key = json.dumps(item, separators=(",", ":"), sort_keys=True)
+    key = _lutKey(item)
     if key not in lutMap:
         lutMap[key] = len(lutMap)
     return lutMap[key]
 
+
+def redownloadReport(previousManifest, manifest):
+    """
+    Compute how much data a client holding all files of the previous build
+    has to download to get all files of the new one.
+    """
+    previousFiles = previousManifest.get("files", {}) if previousManifest else {}
+    report = {"files": 0, "bytes": 0, "changedFiles": 0, "changedBytes": 0}
+    for name, info in manifest["files"].items():
+        size = info.get("size", 0)
+        report["files"] += 1
+        report["bytes"] += size
+        if previousFiles.get(name, {}).get("sha256") != info["sha256"]:
+            report["changedFiles"] += 1
+            report["changedBytes"] += size
+    return report
+
+
+def formatRedownloadReport(report):
+    share = report["changedBytes"] / max(report["bytes"], 1) * 100
+    return (f"Clients re-download {report['changedFiles']} of {report['files']} files, "
+            f"{report['changedBytes']} of {report['bytes']} bytes ({share:.2f} %)")
+
+
+class DataTablesBuilder:
+    """
+    Builds the frontend data - component shards, attribute LUT, LCSC lookup
+    and the manifest describing them - out of a component library.
+
+    Attribute and category ids are persisted in the library, so existing ids
+    never move between builds; new entries are only appended. The compaction
+    mode renumbers everything from scratch.
+
+    Shard boundaries are chosen by content by default: a shard ends after a
+    component whose LCSC code hashes to a cut point (within min/max size
+    limits) and it is named after its first component. Inserting or removing
+    a component thus changes only its own shard instead of shifting all the
+    following ones.
+
+    In the incremental mode, the previous build in the output directory is
+    reused and only the shards whose source rows changed are written again.
+
+    With persistIds disabled, the ids are read from the library but the ids
+    assigned by the build are not written back, so the library is left
+    untouched.
+    """
+    def __init__(self, library, outdir, ignoreoldstock=None,
+                 maxComponentsPerShard=MAX_COMPONENTS_PER_SHARD_DEFAULT,
+                 lookupBucketSize=LOOKUP_BUCKET_SIZE_DEFAULT,
+                 minComponentsPerShard=None, shardBoundaries="content",
+                 formatVersion=WEB_FILE_FORMAT_VERSION, lutMode="global",
+                 searchPartitions=0,
+                 mpnPartitions=MPN_PARTITIONS_DEFAULT,
+                 presortedRows=PRESORTED_ROWS_DEFAULT, cacheSize=CACHE_SIZE_DEFAULT,
+                 codecs=(), jobs=1,
+                 incremental=False, compactIds=False, persistIds=True):
+        self.library = library
+        self.outdir = outdir
+        self.ignoreoldstock = ignoreoldstock
+        self.maxComponentsPerShard = maxComponentsPerShard
+        if minComponentsPerShard is None:
+            minComponentsPerShard = maxComponentsPerShard // 4
+        self.minComponentsPerShard = min(minComponentsPerShard, maxComponentsPerShard)
+        # Expected distance between content-defined cut points past the
+        # minimal shard size; a forced cut at the maximum is then rare.
+        self.shardCutModulus = max(1, (maxComponentsPerShard - self.minComponentsPerShard) // 3)
+        self.shardBoundaries = shardBoundaries
+        self.formatVersion = formatVersion
+        self.columnar = formatVersion >= 3
+        self.lutMode = lutMode
+        self.lookupBucketSize = lookupBucketSize
+        self.presortedRows = presortedRows
+        self.cacheSize = cacheSize
+        self.incremental = incremental
+        self.compactIds = compactIds
+        self.persistIds = persistIds
+        self.codecs = parseCodecs(codecs)
+        self.jobs = jobs
+        self.writer = None
+
+        self.salt = _builderSalt(formatVersion, lutMode)
+        self.previousFiles = {}
+        self.categoryIds = {}
+        self.persistedCategoryIds = {}
+        # Number of ids of every LUT persisted in the library; newer ids follow
+        self.persistedLutSizes = {}
+        self.files = {}
+        self.pendingFiles = []
+        self.categoryEntries = []
+        self.luts = {}
+        # LCSC number -> shard name
+        self.lcscShards = self.newDict()
+        self.searchIndex = SearchIndexBuilder(searchPartitions, cacheSize) if searchPartitions > 0 else None
+        self.mpnIndex = MpnIndexBuilder(mpnPartitions, cacheSize) if mpnPartitions > 0 else None
+        self.totalComponents = 0
+        self.writtenShards = 0
+        self.reusedShards = 0
+        # Category key -> summary file of the previous build; summaries are
+        # loaded a category at a time
+        self.previousSummaries = {}
+
+    def loadPersistentIds(self, lib):
+        if self.compactIds:
+            return
+        for scope in lib.getWebIdScopes():
+            if scope == "categories":
+                self.persistedCategoryIds = lib.getWebIds(scope)
+            elif scope == _lutScope() or scope.startswith(_lutScope("")):
+                self.luts[scope] = self.newDict(lib.iterWebIds(scope))
+                self.persistedLutSizes[scope] = len(self.luts[scope])
+        self.categoryIds = {
+            tuple(json.loads(key)): id
+            for key, id in self.persistedCategoryIds.items()
+        }
+
+    def savePersistentIds(self, lib):
+        newCategoryIds = {
+            _lutKey(list(key)): id for key, id in self.categoryIds.items()
+            if _lutKey(list(key)) not in self.persistedCategoryIds
+        }
+        with lib.startTransaction():
+            if self.compactIds:
+                for scope in lib.getWebIdScopes():
+                    lib.clearWebIds(scope)
+            for scope, lut in self.luts.items():
+                persisted = self.persistedLutSizes.get(scope, 0)
+                lib.addWebIds(scope, ((key, id) for key, id in lut.items() if id >= persisted))
+            lib.addWebIds("categories", newCategoryIds)
+
+    def lut(self, categoryKey):
+        """
+        Return the attribute LUT used by shards of a category
+        """
+        scope = _lutScope(categoryKey if self.lutMode == "category" else None)
+        if scope not in self.luts:
+            self.luts[scope] = self.newDict()
+        return self.luts[scope]
+
+    def newDict(self, items=()):
+        """
+        Return a dictionary for data growing with the catalog size; it is kept
+        on the disk with only the recently used items in memory.
+        """
+        return DiskDict(items, self.cacheSize)
+
+    def previousIdsMatch(self, manifest, luts):
+        """
+        Tell whether the ids used by the previous build agree with the current
+        ones, i.e., whether its shards can be reused.
+        """
+        return (
+            all(self.luts.get(scope, {}).get(_lutKey(entry)) == i
+                for scope, entries in luts.items()
+                for i, entry in enumerate(entries)) and
+            all(self.categoryIds.get((entry["category"], entry["subcategory"])) == entry["id"]
+                for entry in manifest["categories"])
+        )
+
+    def loadPreviousBuild(self):
+        previous = None
+        if self.incremental and not self.compactIds:
+            previous = _loadPreviousBuild(self.outdir, self.formatVersion)
+        if previous is None:
+            clearDir(self.outdir)
+            return
+        manifest, luts = previous
+        if not self.luts and not self.categoryIds:
+            # Nothing persisted in the library yet, adopt ids of the previous build
+            self.luts = {scope: self.newDict(_lutItems(entries)) for scope, entries in luts.items()}
+            self.categoryIds = {
+                (entry["category"], entry["subcategory"]): entry["id"]
+                for entry in manifest["categories"]
+            }
+        if not self.previousIdsMatch(manifest, luts):
+            print("The previous build uses different ids, rebuilding all shards")
+            clearDir(self.outdir)
+            return
+        self.previousFiles = manifest["files"]
+        self.previousSummaries = {
+            _stableComponentFilebase(entry["category"], entry["subcategory"]): entry["summary"]
+            for entry in manifest["categories"] if entry.get("summary")
+        }
+
+    def categoryId(self, catName, subcatName):
+        key = (catName, subcatName)
+        if key not in self.categoryIds:
+            self.categoryIds[key] = max(self.categoryIds.values(), default=0) + 1
+        return self.categoryIds[key]
+
+    def addFile(self, name, kind, written, **properties):
+        """
+        Register a file of the build. Written is a future of the file info
+        given by the artifact writer.
+        """
+        self.pendingFiles.append((name, kind, written, properties))
+
+    def writeFile(self, name, kind, payload, **properties):
+        written = self.writer.write(name, payload, previous=self.previousFiles.get(name))
+        self.addFile(name, kind, written, **properties)
+
+    def resolveFiles(self, wait=True):
+        """
+        Move the registered files to the file list once they are written;
+        unless wait is set, the files still being written are left pending.
+        """
+        pending = []
+        for name, kind, written, properties in self.pendingFiles:
+            if wait or written.done():
+                self.files[name] = {"name": name, "kind": kind, **written.result(), **properties}
+            else:
+                pending.append((name, kind, written, properties))
+        self.pendingFiles = pending
+
+    def cutShardAfter(self, chunk):
+        if len(chunk) >= self.maxComponentsPerShard:
+            return True
+        if self.shardBoundaries == "fixed" or len(chunk) < self.minComponentsPerShard:
+            return False
+        return zlib.crc32(chunk[-1]["lcsc"].encode("utf-8")) % self.shardCutModulus == 0
+
+    def shardName(self, categoryKey, index, chunk):
+        extension = "col.gz" if self.columnar else "jsonl.gz"
+        if self.shardBoundaries == "fixed":
+            return f"components-{categoryKey}-{index:03d}.{extension}"
+        return f"components-{categoryKey}-{chunk[0]['lcsc'].lower()}.{extension}"
+
+    def flushShard(self, chunk, shardName, subcategoryId, attributeLut, previousSummaries):
+        """
+        Write a shard unless the previous build has the same one. Return its
+        fingerprint and summary.
+        """
+        fingerprint = _shardFingerprint(chunk, subcategoryId, self.salt)
+        properties = {
+            "componentCount": len(chunk),
+            "subcategoryId": subcategoryId,
+            "fingerprint": fingerprint,
+        }
+        previous = self.previousFiles.get(shardName)
+        summary = previousSummaries.get(shardName)
+        kept = None
+        if previous is not None and summary is not None and previous.get("fingerprint") == fingerprint:
+            kept = self.writer.keep(shardName, previous)
+        if kept is not None:
+            self.addFile(shardName, "components", kept, **properties)
+            self.reusedShards += 1
+        else:
+            summary = {}
+            shardRows = _componentRows(chunk, subcategoryId, attributeLut, summary)
+            if self.columnar:
+                payload = _columnarShard(shardRows)
+            else:
+                payload = _jsonLinesArtifactPayload(shardRows)
+            self.writeFile(shardName, "components", payload, **properties)
+            self.writtenShards += 1
+        for component in chunk:
+            self.lcscShards[int(component["lcsc"][1:])] = shardName
+        if self.searchIndex is not None:
+            self.searchIndex.addShard(shardName, chunk)
+        if self.mpnIndex is not None:
+            self.mpnIndex.addShard(shardName, chunk)
+        return fingerprint, summary
+
+    def buildCategory(self, catName, subcatName, components):
+        """
+        Build shards and tables of a category out of its components ordered by
+        LCSC code. Return the number of components.
+        """
+        categoryId = self.categoryId(catName, subcatName)
+        categoryKey = _stableComponentFilebase(catName, subcatName)
+        shardNames = []
+        fingerprints = []
+        attributeLut = self.lut(categoryKey)
+        hotTables = {
+            "stock": {"shards": shardNames, "stock": []},
+            "price": {"shards": shardNames, "price": []},
+        }
+        shardSummaries = []
+        shardOffsets = []
+        rowOrders = _RowOrders(self.presortedRows)
+        previousSummaries = {}
+        if categoryKey in self.previousSummaries:
+            previousSummaries = _loadShardSummaries(self.outdir, self.previousSummaries[categoryKey])
+
+        def flush(chunk):
+            shardOffsets.append(rowOrders.rowCount)
+            for component in chunk:
+                rowOrders.add(component)
+            shardName = self.shardName(categoryKey, len(shardNames) + 1, chunk)
+            fingerprint, summary = self.flushShard(
+                chunk, shardName, categoryId, attributeLut, previousSummaries)
+            fingerprints.append(fingerprint)
+            shardNames.append(shardName)
+            shardSummaries.append({
+                "name": shardName,
+                "componentCount": len(chunk),
+                "inStock": sum(1 for component in chunk if component["stock"] > 0),
+                **summary,
+            })
+            for column, values in buildStocktable(chunk).items():
+                hotTables[column][column].append(values)
+
+        chunk = []
+        componentCount = 0
+        for component in components:
+            componentCount += 1
+            chunk.append(component)
+            if not self.cutShardAfter(chunk):
+                continue
+            flush(chunk)
+            chunk = []
+        if chunk:
+            flush(chunk)
+
+        hotNames = {}
+        for column, table in hotTables.items():
+            if self.columnar:
+                name = f"{column}-{categoryKey}.col.gz"
+                payload = _columnarHotTable(column, table)
+            else:
+                name = f"{column}-{categoryKey}.json.gz"
+                payload = _jsonArtifactPayload(table)
+            self.writeFile(name, column, payload, subcategoryId=categoryId)
+            hotNames[column] = name
+
+        summaryName = f"summary-{categoryKey}.json.gz"
+        summary = {
+            "subcategoryId": categoryId,
+            "componentCount": componentCount,
+            "inStock": sum(shard["inStock"] for shard in shardSummaries),
+            **_mergeSummaries(shardSummaries),
+            "shards": shardSummaries,
+        }
+        self.writeFile(summaryName, "summary", _jsonArtifactPayload(summary),
+                       subcategoryId=categoryId)
+
+        orderName = f"order-{categoryKey}.json.gz"
+        orderTable = {
+            "shards": shardNames,
+            "shardOffsets": shardOffsets,
+            "orders": rowOrders.orders(),
+        }
+        self.writeFile(orderName, "order", _jsonArtifactPayload(orderTable),
+                       subcategoryId=categoryId)
+
+        entry = {
+            "id": categoryId,
+            "category": catName,
+            "subcategory": subcatName,
+            "componentCount": componentCount,
+            "shards": shardNames,
+            "stock": hotNames["stock"],
+            "price": hotNames["price"],
+            "summary": summaryName,
+            "order": orderName,
+            "fingerprint": hashlib.sha256("".join(fingerprints).encode("utf-8")).hexdigest(),
+        }
+        if self.lutMode == "category":
+            entry["attributesLut"] = self.writeAttributesLut(attributeLut, categoryKey, categoryId)
+            # The LUT is needed again only when the ids are saved
+            attributeLut.spill()
+        self.categoryEntries.append(entry)
+        self.resolveFiles(wait=False)
+        return componentCount
+
+    def writeAttributesLut(self, attributeLut, categoryKey=None, categoryId=None):
+        if categoryKey is None:
+            name = "attributes-lut.json.gz"
+            properties = {}
+        else:
+            name = f"attributes-lut-{categoryKey}.json.gz"
+            properties = {"subcategoryId": categoryId}
+        self.writeFile(name, "attributes-lut", _lutPayload(attributeLut, self.cacheSize),
+                       entryCount=len(attributeLut), **properties)
+        return name
+
+    def writeLookups(self):
+        lookupFiles = {}
+        buckets = itertools.groupby(self.lcscShards.items(),
+                                    key=lambda item: item[0] // self.lookupBucketSize)
+        for bucket, items in buckets:
+            mapping = {f"C{number}": shardName for number, shardName in items}
+            name = f"lcsc-index-{bucket:05d}.json.gz"
+            index = _lcscIndex(mapping)
+            self.writeFile(name, "lcsc-index", _jsonArtifactPayload(index),
+                           bucket=bucket, entryCount=len(mapping),
+                           rangeCount=len(index["starts"]))
+            lookupFiles[str(bucket)] = name
+        return lookupFiles
+
+    def writeSearchIndex(self):
+        if self.searchIndex is None:
+            return None
+        files = []
+        for partition, data in self.searchIndex.partitions():
+            name = partitionName(partition)
+            self.writeFile(name, "search-index", _jsonArtifactPayload(data),
+                           partition=partition, keyCount=len(data["postings"]))
+            files.append(name)
+        return {"partitions": self.searchIndex.partitionCount, "files": files}
+
+    def writeMpnIndex(self):
+        if self.mpnIndex is None:
+            return None
+        files = []
+        for partition, data in self.mpnIndex.partitions():
+            name = mpnPartitionName(partition)
+            self.writeFile(name, "mpn-index", _jsonArtifactPayload(data),
+                           partition=partition, entryCount=len(data["mpns"]))
+            files.append(name)
+        return {"partitions": self.mpnIndex.partitionCount, "files": files}
+
+    def removeStaleFiles(self):
+        def fileNames(files):
+            for name, info in files.items():
+                yield name
+                for variant in info.get("variants", {}).values():
+                    yield variant["name"]
+
+        current = set(fileNames(self.files))
+        for name in fileNames(self.previousFiles):
+            path = os.path.join(self.outdir, name)
+            if name not in current and os.path.exists(path):
+                os.unlink(path)
+
+    def build(self):
+        Path(self.outdir).mkdir(parents=True, exist_ok=True)
+        self.writer = ArtifactWriter(self.outdir, self.codecs, self.jobs)
+        try:
+            return self.buildTables()
+        finally:
+            self.writer.close()
+            self.close()
+
+    def close(self):
+        """
+        Release the temporary databases backing the LUTs and indices
+        """
+        for lut in self.luts.values():
+            lut.close()
+        self.lcscShards.close()
+        if self.searchIndex is not None:
+            self.searchIndex.close()
+        if self.mpnIndex is not None:
+            self.mpnIndex.close()
+
+    def buildTables(self):
+        lib = PartLibraryDb(self.library)
+        previousManifest = _loadManifest(os.path.join(self.outdir, "manifest.json"))
+        self.loadPersistentIds(lib)
+        self.loadPreviousBuild()
+
+        total = sum(
+            1
+            for catName, subcategories in lib.categories().items()
+            for subcatName in subcategories
+            if _isUsableCategory(catName, subcatName)
+        )
+        processed = 0
+
+        # A single scan of the library; shards are cut from the stream of
+        # components of each category
+        components = lib.iterComponentsByCategory(
+            stockNewerThan=self.ignoreoldstock,
+            fetchSize=max(1000, min(self.maxComponentsPerShard, 5000)))
+        for _, categoryComponents in itertools.groupby(components, key=lambda x: x["category_id"]):
+            first = next(categoryComponents)
+            catName, subcatName = first["category"], first["subcategory"]
+            if catName is None or not _isUsableCategory(catName, subcatName):
+                continue
+            processed += 1
+            componentCount = self.buildCategory(
+                catName, subcatName, itertools.chain([first], categoryComponents))
+            self.totalComponents += componentCount
+            print(f"{(processed / max(total, 1) * 100):.2f} % {catName}: {subcatName} ({componentCount})")
+        self.categoryEntries.sort(key=lambda entry: (entry["category"], entry["subcategory"]))
+        if self.persistIds:
+            self.savePersistentIds(lib)
+        lib.close()
+
+        manifest = {
+            "version": self.formatVersion,
+            "created": datetime.datetime.now().astimezone().replace(microsecond=0).isoformat(),
+            "totalComponents": self.totalComponents,
+            "lookupBucketSize": self.lookupBucketSize,
+            "attributesLut": self.writeAttributesLut(self.lut(None)) if self.lutMode == "global" else None,
+            "categories": self.categoryEntries,
+            "lcscIndex": self.writeLookups(),
+            "searchIndex": self.writeSearchIndex(),
+            "mpnIndex": self.writeMpnIndex(),
+        }
+        self.resolveFiles()
+        manifest["files"] = self.files
+        manifest["contentHash"] = _manifestContentHash(manifest)
+        _writeJsonArtifact(manifest, os.path.join(self.outdir, "manifest.json"))
+        self.removeStaleFiles()
+        if self.incremental:
+            print(f"Shards written: {self.writtenShards}, reused: {self.reusedShards}")
+        if previousManifest is not None:
+            print(formatRedownloadReport(redownloadReport(previousManifest, manifest)))
+        return manifest
+
+def _validateCodecs(ctx, param, value):
+    try:
+        parseCodecs(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return list(value)
+
+def _buildOptions(command):
+    """
+    Decorate a command with options shared by all commands building tables
+    """
+    options = [
+        click.option("--jobs", type=int, default=1,
+            help="Number of background threads compressing the output. Defaults to 1, set to 0 to use all cores"),
+        click.option("--codec", "codecs", multiple=True, callback=_validateCodecs,
+            help="Compression codec given as name[:level]; one of gzip (used by the frontend, level 9 by default), "
+                 "br or zstd. Codecs other than gzip produce precompressed variants stored side by side. Can be repeated"),
+        click.option("--ignoreoldstock", type=int, default=None,
+            help="Ignore components that weren't on stock for more than n days"),
+        click.option("--max-components-per-shard", "maxComponentsPerShard", type=int,
+            default=MAX_COMPONENTS_PER_SHARD_DEFAULT, show_default=True,
+            help="Maximum number of components stored in a single frontend shard"),
+        click.option("--min-components-per-shard", "minComponentsPerShard", type=int,
+            default=None,
+            help="Minimum number of components in a content-defined shard. Defaults to a quarter of the maximum"),
+        click.option("--shard-boundaries", "shardBoundaries", type=click.Choice(SHARD_BOUNDARIES),
+            default="content", show_default=True,
+            help="Cut shards at content-defined points or every maximum number of components"),
+        click.option("--format-version", "formatVersion", type=click.IntRange(min(WEB_FILE_FORMAT_VERSIONS), max(WEB_FILE_FORMAT_VERSIONS)),
+            default=WEB_FILE_FORMAT_VERSION, show_default=True,
+            help="Format of the shards; version 3 is columnar binary and it is not read by the web frontend yet"),
+        click.option("--lut-mode", "lutMode", type=click.Choice(LUT_MODES), default="global",
+            show_default=True,
+            help="Emit a single global attribute LUT or one LUT per category with local ids"),
+        click.option("--lookup-bucket-size", "lookupBucketSize", type=int,
+            default=LOOKUP_BUCKET_SIZE_DEFAULT, show_default=True,
+            help="Number of LCSC numeric codes stored in a single lookup shard"),
+        click.option("--search-partitions", "searchPartitions", type=click.IntRange(min=0),
+            default=0, show_default=True,
+            help=f"Number of files the inverted word search index is split into, e.g. {SEARCH_PARTITIONS_DEFAULT}; "
+                 "0 disables the index. The frontend doesn't read the index"),
+        click.option("--presorted-rows", "presortedRows", type=click.IntRange(min=0),
+            default=PRESORTED_ROWS_DEFAULT, show_default=True,
+            help="Number of rows of each category stored in presorted orders by price, stock and joints; 0 stores whole permutations"),
+        click.option("--cache-size", "cacheSize", type=click.IntRange(min=1),
+            default=CACHE_SIZE_DEFAULT, show_default=True,
+            help="Number of entries of LUTs and indices kept in memory; the rest is spilled to a temporary file"),
+        click.option("--mpn-partitions", "mpnPartitions", type=click.IntRange(min=0),
+            default=MPN_PARTITIONS_DEFAULT, show_default=True,
+            help="Number of files the exact MFR number index is split into; 0 disables the index"),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
 @click.command()
 @click.argument("library", type=click.Path(dir_okay=False))
 @click.argument("outdir", type=click.Path(file_okay=False))
-@click.option("--ignoreoldstock", type=int, default=None,
-    help="Ignore components that weren't on stock for more than n days")
-@click.option("--jobs", type=int, default=1,
-    help="Number of parallel processes. Defaults to 1, set to 0 to use all cores")
-@click.option("--max-components-per-shard", type=int, default=MAX_COMPONENTS_PER_SHARD_DEFAULT,
-    show_default=True,
-    help="Maximum number of components stored in a single frontend shard")
-@click.option("--lookup-bucket-size", type=int, default=LOOKUP_BUCKET_SIZE_DEFAULT,
-    show_default=True,
-    help="Number of LCSC numeric codes stored in a single lookup shard")
-def buildtables(library, outdir, ignoreoldstock, jobs, max_components_per_shard, lookup_bucket_size):
+@_buildOptions
+@click.option("--incremental", is_flag=True,
+    help="Reuse the previous build in OUTDIR and rewrite only changed shards")
+@click.option("--compact-ids", is_flag=True,
+    help="Renumber attribute and category ids from scratch; clients will download everything again")
+def buildtables(library, outdir, incremental, compact_ids, **options):
     """
     Build datatables out of the LIBRARY and save them in OUTDIR
     """
-    lib = PartLibraryDb(library)
-    Path(outdir).mkdir(parents=True, exist_ok=True)
-    clearDir(outdir)
-    del jobs  # kept for CLI compatibility with the previous builder
-
-    categories = lib.categories()
-    sortedCategories = [
-        (catName, sorted(subcategories))
-        for catName, subcategories in sorted(categories.items())
-    ]
-    total = sum(
-        1
-        for catName, subcategories in sortedCategories
-        for subcatName in subcategories
-        if _isUsableCategory(catName, subcatName)
-    )
-    processed = 0
-
-    files = {}
-    categoryEntries = []
-    attributeLut = {}
-    lookupBuckets = {}
-    totalComponents = 0
-    categoryId = 0
-
-    for catName, subcategories in sortedCategories:
-        for subcatName in subcategories:
-            if not _isUsableCategory(catName, subcatName):
-                continue
-            processed += 1
-            componentCount = lib.countCategoryComponents(
-                catName,
-                subcatName,
-                stockNewerThan=ignoreoldstock
-            )
-            if componentCount == 0:
-                continue
+    builder = DataTablesBuilder(library, outdir, incremental=incremental,
+                                compactIds=compact_ids, **options)
+    builder.build()
 
-            categoryId += 1
-            categoryKey = _stableComponentFilebase(catName, subcatName)
-            shardNames = []
-            totalComponents += componentCount
-            print(f"{((processed - 1) / max(total, 1) * 100):.2f} % {catName}: {subcatName} ({componentCount})")
 
-            chunk = []
-            shardIndex = 0
-            for component in lib.iterCategoryComponents(
-                    catName, subcatName, stockNewerThan=ignoreoldstock,
-                    fetchSize=max(1000, min(max_components_per_shard, 5000))):
-                chunk.append(component)
-                if len(chunk) < max_components_per_shard:
-                    continue
-                shardIndex += 1
-                shardName = f"components-{categoryKey}-{shardIndex:03d}.jsonl.gz"
-                _flushComponentShard(
-                    chunk, shardName, outdir, categoryId, attributeLut,
-                    files, lookupBuckets, lookup_bucket_size
-                )
-                shardNames.append(shardName)
-                chunk = []
-
-            if chunk:
-                shardIndex += 1
-                shardName = f"components-{categoryKey}-{shardIndex:03d}.jsonl.gz"
-                _flushComponentShard(
-                    chunk, shardName, outdir, categoryId, attributeLut,
-                    files, lookupBuckets, lookup_bucket_size
-                )
-                shardNames.append(shardName)
-
-            categoryEntries.append({
-                "id": categoryId,
-                "category": catName,
-                "subcategory": subcatName,
-                "componentCount": componentCount,
-                "shards": shardNames,
-            })
+@click.command()
+@click.argument("library", type=click.Path(dir_okay=False, exists=True))
+@click.argument("outdir", type=click.Path(file_okay=False, exists=True))
+@_buildOptions
+def verifybuild(library, outdir, **options):
+    """
+    Rebuild datatables out of the LIBRARY into a temporary directory and check
+    that the result matches the build in OUTDIR byte for byte. Pass the same
+    options the build in OUTDIR was made with. The LIBRARY is not modified.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        DataTablesBuilder(library, tmpdir, persistIds=False, **options).build()
+        differences = compareBuilds(outdir, tmpdir)
+    for difference in differences:
+        print(difference)
+    if differences:
+        raise click.ClickException(f"The build is not reproducible, {len(differences)} files differ")
+    print("The build is reproducible")
 
-    attributesLutFilename = "attributes-lut.json.gz"
-    attributesLutPath = os.path.join(outdir, attributesLutFilename)
-    attributesLutHash = _writeJsonArtifact(_lutToEntries(attributeLut), attributesLutPath, compress=True)
-    files[attributesLutFilename] = {
-        "name": attributesLutFilename,
-        "kind": "attributes-lut",
-        "sha256": attributesLutHash,
-        "entryCount": len(attributeLut),
-    }
 
-    lookupFiles = {}
-    for bucket, mapping in sorted(lookupBuckets.items()):
-        lookupName = f"lookup-{bucket:05d}.json.gz"
-        lookupPath = os.path.join(outdir, lookupName)
-        lookupHash = _writeJsonArtifact(mapping, lookupPath, compress=True)
-        files[lookupName] = {
-            "name": lookupName,
-            "kind": "lookup",
-            "sha256": lookupHash,
-            "bucket": bucket,
-            "entryCount": len(mapping),
-        }
-        lookupFiles[str(bucket)] = lookupName
-
-    manifest = {
-        "version": WEB_FILE_FORMAT_VERSION,
-        "created": datetime.datetime.now().astimezone().replace(microsecond=0).isoformat(),
-        "totalComponents": totalComponents,
-        "lookupBucketSize": lookup_bucket_size,
-        "attributesLut": attributesLutFilename,
-        "categories": categoryEntries,
-        "lookupBuckets": lookupFiles,
-        "files": files,
-    }
-    _writeJsonArtifact(manifest, os.path.join(outdir, "manifest.json"), compress=False)
+@click.command()
+@click.argument("previous", type=click.Path(dir_okay=False, exists=True))
+@click.argument("current", type=click.Path(dir_okay=False, exists=True))
+def builddiff(previous, current):
+    """
+    Report how much data clients re-download when going from the build
+    described by PREVIOUS manifest to the one described by CURRENT manifest.
+    """
+    report = redownloadReport(_loadManifest(previous), _loadManifest(current))
+    print(formatRedownloadReport(report))
@@ -0,0 +1,198 @@
+"""
+Dictionaries backed by a temporary SQLite database, so the LUTs and indices
+of the table builders hold a bounded number of entries in memory regardless
+of the catalog size. The builders still hold the tables of the category
+being built, so the memory grows with the size of the largest category.
+"""
+
+import itertools
+import json
+import sqlite3
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+CACHE_SIZE_DEFAULT = 200000
+
+
+def _temporaryDb():
+    # An empty filename gives a private on-disk database deleted on close
+    conn = sqlite3.connect("")
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -16000")
+    return conn
+
+
+class LruCache(MutableMapping):
+    """
+    A dictionary holding at most maxSize most recently used items; older
+    items are silently dropped
+    """
+    def __init__(self, maxSize=CACHE_SIZE_DEFAULT):
+        self.maxSize = maxSize
+        self.data = OrderedDict()
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        self.data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxSize:
+            self.data.popitem(last=False)
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class DiskDict(MutableMapping):
+    """
+    A dictionary stored in a temporary SQLite database with a bounded write
+    back cache of the most recently used items. Keys are strings or integers,
+    values anything JSON-serializable. Iteration goes in the order of keys.
+    """
+    def __init__(self, items=(), cacheSize=CACHE_SIZE_DEFAULT):
+        self.cacheSize = max(1, cacheSize)
+        self.conn = _temporaryDb()
+        self.conn.execute("CREATE TABLE kv (key PRIMARY KEY NOT NULL, value TEXT NOT NULL) WITHOUT ROWID")
+        self.cache = OrderedDict()
+        self.dirty = set()
+        self.length = 0
+        # Until the cache overflows for the first time, everything is in memory
+        self.spilled = False
+        self.update(items)
+
+    def _load(self, key):
+        if not self.spilled:
+            return None
+        return self.conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+
+    def _cache(self, key, value):
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        if len(self.cache) <= self.cacheSize:
+            return
+        # Evict a tenth of the cache at once to write in batches
+        evicted = [self.cache.popitem(last=False) for _ in range(max(1, self.cacheSize // 10))]
+        self._write([(key, value) for key, value in evicted if key in self.dirty])
+        self.dirty.difference_update(key for key, _ in evicted)
+
+    def _write(self, items):
+        self.spilled = True
+        self.conn.executemany("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+            [(key, json.dumps(value, separators=(",", ":"))) for key, value in items])
+
+    def flush(self):
+        """
+        Write all modified items to the disk
+        """
+        self._write([(key, self.cache[key]) for key in self.dirty])
+        self.dirty.clear()
+
+    def spill(self):
+        """
+        Write all items to the disk and empty the cache, e.g., once the
+        dictionary is not going to be used for a while
+        """
+        self.flush()
+        self.cache.clear()
+
+    def __getitem__(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        row = self._load(key)
+        if row is None:
+            raise KeyError(key)
+        value = json.loads(row[0])
+        self._cache(key, value)
+        return value
+
+    def __contains__(self, key):
+        return key in self.cache or self._load(key) is not None
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self.length += 1
+        self.dirty.add(key)
+        self._cache(key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.cache.pop(key, None)
+        self.dirty.discard(key)
+        self.conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+        self.length -= 1
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def items(self):
+        self.flush()
+        for key, value in self.conn.execute("SELECT key, value FROM kv ORDER BY key"):
+            yield key, json.loads(value)
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    def close(self):
+        self.conn.close()
+
+
+class DiskMultiMap:
+    """
+    An append-only mapping of keys to lists of values. Values are buffered in
+    memory and spilled to a temporary SQLite database once the buffer is full.
+    Values are SQLite scalars; they are read back in the order they were
+    added.
+    """
+    def __init__(self, bufferSize=CACHE_SIZE_DEFAULT):
+        self.bufferSize = max(1, bufferSize)
+        self.conn = _temporaryDb()
+        self.conn.execute("CREATE TABLE kv (key NOT NULL, value NOT NULL)")
+        self.buffer = []
+        self.spilled = False
+        self.indexed = False
+
+    def add(self, key, value):
+        self.buffer.append((key, value))
+        if len(self.buffer) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.spilled = True
+        self.conn.executemany("INSERT INTO kv (key, value) VALUES (?, ?)", self.buffer)
+        self.buffer = []
+
+    def groups(self):
+        """
+        Yield (key, list of values) in the order of keys
+        """
+        if not self.spilled:
+            # The sort is stable, values stay in the order they were added
+            rows = sorted(self.buffer, key=lambda row: row[0])
+        else:
+            self.flush()
+            if not self.indexed:
+                self.conn.execute("CREATE INDEX kv_key ON kv (key)")
+                self.indexed = True
+            rows = self.conn.execute("SELECT key, value FROM kv ORDER BY key, rowid")
+        for key, group in itertools.groupby(rows, key=lambda row: row[0]):
+            yield key, [value for _, value in group]
+
+    def close(self):
+        self.conn.close()
@@ -151,6 +151,14 @@ class PartLibraryDb:
                 fetched_at INTEGER NOT NULL,
                 payload TEXT NOT NULL
             )""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS web_ids (
+                scope TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (scope, id),
+                UNIQUE (scope, key)
+            )""")
         self.conn.execute("""
             CREATE VIEW IF NOT EXISTS v_components AS
                 SELECT
@@ -305,8 +313,9 @@ class PartLibraryDb:
 
     def iterCategoryComponents(self, category, subcategory, stockNewerThan=None, fetchSize=1000):
         """
-        Yield category components lazily. This is the memory-safe variant used by
-        the frontend table builder for large subcategories.
+        Yield category components lazily ordered by their LCSC code. This is the
+        memory-safe variant used by the frontend table builder for large
+        subcategories.
         """
         catId = self.getCategoryId(category, subcategory)
         if catId is None:
@@ -314,10 +323,12 @@ class PartLibraryDb:
         if stockNewerThan is None:
             cursor = self.conn.cursor().execute("""
                 SELECT * FROM v_components WHERE category_id = ?
+                ORDER BY lcsc
                 """, (catId,))
         else:
             cursor = self.conn.cursor().execute("""
                 SELECT * FROM v_components WHERE category_id = ? and last_on_stock > ?
+                ORDER BY lcsc
                 """, (catId, int(time.time()) - stockNewerThan * 24 * 3600))
         while True:
             rows = cursor.fetchmany(fetchSize)
@@ -326,6 +337,60 @@ class PartLibraryDb:
             for row in rows:
                 yield dbToComp(row)
 
+    def countComponentsByCategory(self, stockNewerThan=None):
+        """
+        Return a dictionary category id -> number of components
+        """
+        if stockNewerThan is None:
+            result = self.conn.execute("""
+                SELECT category_id, COUNT() AS count FROM components
+                GROUP BY category_id
+                """)
+        else:
+            result = self.conn.execute("""
+                SELECT category_id, COUNT() AS count FROM components
+                WHERE last_on_stock > ?
+                GROUP BY category_id
+                """, (int(time.time()) - stockNewerThan * 24 * 3600,))
+        return {x["category_id"]: x["count"] for x in result}
+
+    def iterComponentsByCategory(self, stockNewerThan=None, fetchSize=1000, categoryRange=None):
+        """
+        Yield all components in a single scan ordered by their category id and
+        LCSC code. Manufacturers and categories are resolved from tables
+        preloaded into memory instead of joining them for every row. The scan
+        can be limited to an inclusive range of category ids.
+        """
+        manufacturers = {x["id"]: x["name"] for x in self.conn.execute(
+            "SELECT id, name FROM manufacturers")}
+        categories = {x["id"]: (x["category"], x["subcategory"]) for x in self.conn.execute(
+            "SELECT id, category, subcategory FROM categories")}
+        conditions = []
+        params = []
+        if stockNewerThan is not None:
+            conditions.append("last_on_stock > ?")
+            params.append(int(time.time()) - stockNewerThan * 24 * 3600)
+        if categoryRange is not None:
+            conditions.append("category_id BETWEEN ? AND ?")
+            params.extend(categoryRange)
+        cursor = self.conn.cursor().execute(f"""
+            SELECT lcsc, category_id, mfr, package, joints, manufacturer_id, basic,
+                   preferred, description, datasheet, stock, last_on_stock, price,
+                   extra, jlc_extra
+            FROM components
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY category_id, lcsc
+            """, params)
+        while True:
+            rows = cursor.fetchmany(fetchSize)
+            if not rows:
+                break
+            for row in rows:
+                comp = dbToComp(row)
+                comp["category"], comp["subcategory"] = categories.get(comp["category_id"], (None, None))
+                comp["manufacturer"] = manufacturers.get(comp.pop("manufacturer_id"))
+                yield comp
+
     def addComponent(self, component, flag=None):
         cur = self.conn.cursor()
         manId = self.getOrCreateManufacturerId(_componentManufacturer(component))
@@ -472,6 +537,43 @@ class PartLibraryDb:
             return {}
         return _jsonLoadsDict(result["payload"])
 
+    def getWebIds(self, scope):
+        """
+        Return ids assigned to frontend entities (e.g., attribute LUT entries)
+        of a given scope by previous builds as a dictionary key -> id
+        """
+        return dict(self.iterWebIds(scope))
+
+    def iterWebIds(self, scope):
+        """
+        Iterate (key, id) pairs of ids of a given scope without loading them
+        all into memory
+        """
+        cursor = self.conn.execute(
+            "SELECT id, key FROM web_ids WHERE scope = ?", (scope,))
+        for x in cursor:
+            yield x["key"], x["id"]
+
+    def addWebIds(self, scope, ids):
+        """
+        Persist new ids given as a dictionary key -> id or an iterable of
+        (key, id) pairs
+        """
+        if isinstance(ids, dict):
+            ids = ids.items()
+        self.conn.executemany("""
+            INSERT INTO web_ids (scope, id, key) VALUES (?, ?, ?)
+            """, ((scope, id, key) for key, id in ids))
+        self._commit()
+
+    def getWebIdScopes(self):
+        return [x["scope"] for x in self.conn.execute(
+            "SELECT DISTINCT scope FROM web_ids ORDER BY scope")]
+
+    def clearWebIds(self, scope):
+        self.conn.execute("DELETE FROM web_ids WHERE scope = ?", (scope,))
+        self._commit()
+
     def getNOldest(self, count):
         cursor = self.conn.cursor()
         result = cursor.execute("SELECT lcsc FROM components ORDER BY last_update ASC LIMIT ?", (count,))
@@ -0,0 +1,275 @@
+"""
+Inverted word search index over the published component shards. It is
+optional and it is not read by the frontend, which matches search words as
+substrings of the component text; the index answers word queries only.
+
+The index maps keys to postings - LCSC numbers of the components containing
+them grouped by the shard they live in. There are two kinds of keys:
+
+- "w:<word>": a whitespace-separated word of the LCSC code, MFR number or
+  description, lowercased the same way the frontend splits search strings,
+- "t:<trigram>": a trigram of the lowercased MFR number, so a part of an MFR
+  number can be searched for.
+
+Keys are partitioned by CRC32 into search-XXX.json.gz files. Every file holds
+a table of shard names and for every key a flat list of groups: shard index,
+number of components and their delta-encoded LCSC numbers.
+
+Exact MPN lookups use a separate index of normalized MFR numbers (everything
+but ASCII letters and digits stripped, lowercased) partitioned by CRC32 into
+mpn-XXXX.json.gz files. Every file holds a table of shard names and for every
+normalized MFR number a list of [LCSC code, shard index] pairs.
+"""
+
+import gzip
+import itertools
+import json
+import os
+import re
+import zlib
+
+from jlcparts.diskdict import CACHE_SIZE_DEFAULT, DiskMultiMap
+
+SEARCH_PARTITIONS_DEFAULT = 256
+MPN_PARTITIONS_DEFAULT = 1024
+
+
+def searchWords(text):
+    return [x.lower() for x in text.split()]
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def componentKeys(lcsc, mfr, description):
+    """
+    Return the set of index keys of a component
+    """
+    mfr = (mfr or "").strip()
+    keys = {"w:" + word for word in searchWords(f"{lcsc} {mfr} {description or ''}")}
+    keys.update("t:" + x for x in trigrams(mfr.lower()))
+    return keys
+
+
+def partitionForKey(key, partitionCount):
+    return zlib.crc32(key.encode("utf-8")) % partitionCount
+
+
+def partitionName(partition):
+    return f"search-{partition:03d}.json.gz"
+
+
+def normalizeMpn(mfr):
+    """
+    Normalize an MFR number for exact lookups; "LM358DR-2G" and "lm358dr2g"
+    are the same part. Only ASCII letters and digits are kept, so the result
+    is the same as of normalizeMpn in web/src/db.js regardless of Unicode
+    case folding differences.
+    """
+    return re.sub(r"[^0-9A-Za-z]+", "", mfr).lower()
+
+
+def mpnPartitionName(partition):
+    return f"mpn-{partition:04d}.json.gz"
+
+
+def _partitionedKey(partition, key):
+    # Postings are spilled to disk under keys sorting by partition first
+    return f"{partition:06d}:{key}"
+
+
+def _partitionGroups(groups):
+    """
+    Group (partitioned key, values) pairs by partitions; yield (partition,
+    list of (key, values))
+    """
+    partitionKeys = lambda item: int(item[0].split(":", 1)[0])
+    for partition, items in itertools.groupby(groups, key=partitionKeys):
+        yield partition, [(key.split(":", 1)[1], values) for key, values in items]
+
+
+class SearchIndexBuilder:
+    """
+    Collects postings of components as the shards are built and encodes them
+    into partitions. Components have to be added in the order of shards and
+    LCSC codes. Postings are spilled to a temporary file.
+    """
+    def __init__(self, partitionCount=SEARCH_PARTITIONS_DEFAULT, bufferSize=CACHE_SIZE_DEFAULT):
+        self.partitionCount = partitionCount
+        self.shards = []
+        # partitioned key -> (shard index << 32 | LCSC number)
+        self.postings = DiskMultiMap(bufferSize)
+
+    def addShard(self, shardName, components):
+        shardIdx = len(self.shards)
+        self.shards.append(shardName)
+        for component in components:
+            posting = shardIdx << 32 | int(component["lcsc"][1:])
+            for key in componentKeys(component["lcsc"], component["mfr"], component["description"]):
+                self.postings.add(_partitionedKey(partitionForKey(key, self.partitionCount), key), posting)
+
+    def partitions(self):
+        """
+        Yield (partition, data) for all non-empty partitions
+        """
+        for partition, keys in _partitionGroups(self.postings.groups()):
+            shardTable = {}
+            postings = {}
+            for key, keyPostings in keys:
+                encoded = []
+                previousShard = None
+                for posting in keyPostings:
+                    shardIdx = posting >> 32
+                    number = posting & 0xFFFFFFFF
+                    if shardIdx != previousShard:
+                        encoded.append(shardTable.setdefault(self.shards[shardIdx], len(shardTable)))
+                        encoded.append(0)
+                        countIdx = len(encoded) - 1
+                        previousShard = shardIdx
+                        previousNumber = 0
+                    encoded.append(number - previousNumber)
+                    encoded[countIdx] += 1
+                    previousNumber = number
+                postings[key] = encoded
+            yield partition, {"shards": list(shardTable), "postings": postings}
+
+    def close(self):
+        self.postings.close()
+
+
+def decodePostings(data, key):
+    """
+    Decode postings of a key in a partition into a dictionary shard name ->
+    list of LCSC numbers
+    """
+    encoded = data["postings"].get(key, [])
+    result = {}
+    i = 0
+    while i < len(encoded):
+        shardName = data["shards"][encoded[i]]
+        count = encoded[i + 1]
+        numbers = result.setdefault(shardName, [])
+        number = 0
+        for delta in encoded[i + 2:i + 2 + count]:
+            number += delta
+            numbers.append(number)
+        i += 2 + count
+    return result
+
+
+def _postingSet(postings):
+    return {(shardName, number) for shardName, numbers in postings.items() for number in numbers}
+
+
+def querySearchIndex(outdir, searchString, manifest=None):
+    """
+    Resolve a search string against the search index of a build. This is a
+    word search: a component is a candidate if every word of the search
+    string is a whole word of its LCSC code, MFR number or description, or a
+    part of its MFR number. Words shorter than 3 characters match anything as
+    they cannot be looked up by trigrams. Unlike the frontend, which matches
+    words as substrings of the whole component text, a part of a description
+    word doesn't match.
+
+    Return a dictionary shard name -> sorted list of candidate LCSC codes,
+    or None if the search string doesn't constrain the results and all shards
+    have to be scanned. Only the partitions holding the looked up keys are
+    read.
+    """
+    if manifest is None:
+        with open(os.path.join(outdir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    index = manifest.get("searchIndex")
+    if index is None:
+        raise RuntimeError("The build contains no search index")
+    partitionCache = {}
+
+    def lookup(key):
+        partition = partitionForKey(key, index["partitions"])
+        name = partitionName(partition)
+        if name not in index["files"]:
+            return set()
+        if name not in partitionCache:
+            with gzip.open(os.path.join(outdir, name), "rt", encoding="utf-8") as f:
+                partitionCache[name] = json.load(f)
+        return _postingSet(decodePostings(partitionCache[name], key))
+
+    candidates = None
+    for word in searchWords(searchString):
+        if len(word) < 3:
+            continue
+        matches = lookup("w:" + word)
+        mfrMatches = None
+        for trigram in sorted(trigrams(word)):
+            trigramMatches = lookup("t:" + trigram)
+            mfrMatches = trigramMatches if mfrMatches is None else mfrMatches & trigramMatches
+            if not mfrMatches:
+                break
+        matches |= mfrMatches
+        candidates = matches if candidates is None else candidates & matches
+    if candidates is None:
+        return None
+    result = {}
+    for shardName, number in sorted(candidates):
+        result.setdefault(shardName, []).append(f"C{number}")
+    return result
+
+
+class MpnIndexBuilder:
+    """
+    Collects normalized MFR numbers of components as the shards are built and
+    encodes them into partitions. Entries are spilled to a temporary file.
+    """
+    def __init__(self, partitionCount=MPN_PARTITIONS_DEFAULT, bufferSize=CACHE_SIZE_DEFAULT):
+        self.partitionCount = partitionCount
+        self.shards = []
+        # partitioned normalized MFR number -> (shard index << 32 | LCSC number)
+        self.entries = DiskMultiMap(bufferSize)
+
+    def addShard(self, shardName, components):
+        shardIdx = len(self.shards)
+        self.shards.append(shardName)
+        for component in components:
+            mpn = normalizeMpn(component["mfr"] or "")
+            if mpn == "":
+                continue
+            partition = partitionForKey(mpn, self.partitionCount)
+            self.entries.add(_partitionedKey(partition, mpn), shardIdx << 32 | int(component["lcsc"][1:]))
+
+    def partitions(self):
+        """
+        Yield (partition, data) for all non-empty partitions
+        """
+        for partition, mpns in _partitionGroups(self.entries.groups()):
+            shardTable = {}
+            encoded = {}
+            for mpn, entries in mpns:
+                encoded[mpn] = [
+                    [f"C{entry & 0xFFFFFFFF}", shardTable.setdefault(self.shards[entry >> 32], len(shardTable))]
+                    for entry in sorted(entries, key=lambda entry: entry & 0xFFFFFFFF)
+                ]
+            yield partition, {"shards": list(shardTable), "mpns": encoded}
+
+    def close(self):
+        self.entries.close()
+
+
+def lookupMpn(outdir, mfr, manifest=None):
+    """
+    Find components with the given MFR number in a build. Return a list of
+    (LCSC code, shard name) pairs; only a single index file is read.
+    """
+    if manifest is None:
+        with open(os.path.join(outdir, "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+    index = manifest.get("mpnIndex")
+    if index is None:
+        raise RuntimeError("The build contains no MPN index")
+    mpn = normalizeMpn(mfr)
+    name = mpnPartitionName(partitionForKey(mpn, index["partitions"]))
+    if mpn == "" or name not in index["files"]:
+        return []
+    with gzip.open(os.path.join(outdir, name), "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(lcsc, data["shards"][shardIdx]) for lcsc, shardIdx in data["mpns"].get(mpn, [])]
@@ -5,7 +5,9 @@ import time
 
 import click
 
-from jlcparts.datatables import buildtables, normalizeAttribute
+from jlcparts.benchmark import benchfts, benchscan, benchshards, benchwebdb, webdbprofile
+from jlcparts.datatables import (builddiff, buildtables, normalizeAttribute,
+                                 verifybuild)
 from jlcparts.lcsc import pullPreferredComponents
 from jlcparts.partLib import (PartLibrary, PartLibraryDb, getLcscExtraNew,
                               loadJlcTable, loadJlcTableLazy, parsePrice)
@@ -308,12 +310,19 @@ cli.add_command(getLibrary)
 cli.add_command(listcategories)
 cli.add_command(listattributes)
 cli.add_command(buildtables)
+cli.add_command(builddiff)
+cli.add_command(verifybuild)
 cli.add_command(buildwebdb)
 cli.add_command(updatePreferred)
 cli.add_command(fetchDetails)
 cli.add_command(fetchDb)
 cli.add_command(fetchTable)
 cli.add_command(testComponent)
+cli.add_command(benchshards)
+cli.add_command(benchscan)
+cli.add_command(benchwebdb)
+cli.add_command(benchfts)
+cli.add_command(webdbprofile)
 
 if __name__ == "__main__":
     cli()
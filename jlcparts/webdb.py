@@ -1,20 +1,30 @@
+import hashlib
 import json
+import math
 import os
 import sqlite3
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import click
 
 from .datatables import (
+    _builderSalt,
     _mergeAttributes,
+    _priceAtMoq,
     crushImages,
     extractAttributesFromDescription,
     normalizeAttribute,
+    splitAttributeValue,
     trimLcscUrl,
     weakUpdateParameters,
 )
+from .diskdict import CACHE_SIZE_DEFAULT, DiskDict
 from .partLib import PartLibraryDb
+from . import searchindex
+from .searchindex import normalizeMpn
 
 
 def _component_status(component):
@@ -48,6 +58,245 @@ def _normalized_attributes(component):
     return normalized
 
 
+# Bump whenever the schema changes so stale DBs are rebuilt instead of updated
+SCHEMA_VERSION = 10
+
+# Stock and price change between almost every update, so they are not
+# hashed; an update compares them separately and rewrites them in place
+_HASHED_FIELDS = [
+    "lcsc",
+    "category",
+    "subcategory",
+    "mfr",
+    "manufacturer",
+    "package",
+    "joints",
+    "basic",
+    "preferred",
+    "description",
+    "datasheet",
+    "extra",
+    "jlc_extra",
+]
+
+
+def _hash64(item):
+    payload = json.dumps(item, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(payload, digest_size=8).digest(), "little", signed=True)
+
+
+def _content_hash(component):
+    """
+    Return a signed 64-bit hash of the source fields the web DB rows of a
+    component are built from, except stock and price
+    """
+    return _hash64([component.get(field) for field in _HASHED_FIELDS])
+
+
+def _stock_hash(stock, price):
+    """
+    Return a signed 64-bit hash of the stock and the price, given as the JSON
+    stored in component_details, of a component
+    """
+    return _hash64([stock, price])
+
+
+def _numeric_values(value):
+    """
+    Yield (value name, unit, number) of the numeric values of a normalized
+    attribute
+    """
+    for name, item in value.get("values", {}).items():
+        number, unit = item
+        if isinstance(number, (int, float)) and not isinstance(number, bool) and math.isfinite(number):
+            yield name, unit, float(number)
+
+
+def _price_breaks(component):
+    """
+    Yield (q_from, q_to, unit price) of the price tiers of a component; q_to
+    is None for the last, unbounded tier
+    """
+    seen = set()
+    for tier in component["price"]:
+        if tier["qFrom"] in seen:
+            continue
+        seen.add(tier["qFrom"])
+        yield int(tier["qFrom"]), tier.get("qTo"), float(tier["price"])
+
+
+def _builder_salt():
+    """
+    Return a fingerprint of the code producing the web DB; content hashes of
+    a DB built by a different version cannot be compared
+    """
+    h = hashlib.sha256(_builderSalt("webdb", SCHEMA_VERSION).encode("utf-8"))
+    for filename in [searchindex.__file__, __file__]:
+        h.update(Path(filename).read_bytes())
+    return h.hexdigest()
+
+
+BATCH_SIZE_DEFAULT = 10000
+
+# With trigram, substring queries are written as LIKE or GLOB over the FTS
+# columns; the index narrows the candidates and the content table verifies
+# them, so no positions are stored in either case. Without positions, a
+# trigram MATCH of more than 3 characters is a phrase query, which FTS5
+# rejects, so a trigram index is queried by LIKE and GLOB only.
+FTS_TOKENIZERS = ["unicode61", "trigram"]
+# How the full text index of each tokenizer is queried, stored in meta
+FTS_QUERIES = {"unicode61": "match", "trigram": "like"}
+
+# Rows of updated and removed components are deleted before the inserts. The
+# FTS index has external content, so its entry is removed using the old
+# values of the component rows before the rows themselves.
+_DELETES = {
+    "component_fts": """
+        INSERT INTO component_fts(component_fts, rowid, lcsc, mfr, description)
+            SELECT 'delete', component_id, lcsc, mfr, description
+            FROM component_search WHERE component_id = ?
+        """,
+    "component_mpns": """
+        DELETE FROM component_mpns
+        WHERE normalized_mpn = (SELECT normalize_mpn(mfr) FROM components WHERE component_id = ?1)
+            AND component_id = ?1
+        """,
+    "component_attributes": "DELETE FROM component_attributes WHERE component_id = ?",
+    "component_numeric_attributes": "DELETE FROM component_numeric_attributes WHERE component_id = ?",
+    "price_breaks": "DELETE FROM price_breaks WHERE component_id = ?",
+    "component_details": "DELETE FROM component_details WHERE component_id = ?",
+    "components": "DELETE FROM components WHERE component_id = ?",
+}
+
+# Components whose stock or price changed only are updated in place; their
+# price breaks are deleted and inserted again
+_UPDATES = {
+    "components": "UPDATE components SET stock = ?, price_at_moq = ? WHERE component_id = ?",
+    "component_details": "UPDATE component_details SET price = ? WHERE component_id = ?",
+}
+
+_INSERTS = {
+    "categories": "INSERT INTO categories(category_id, category, subcategory) VALUES (?, ?, ?)",
+    "manufacturers": "INSERT INTO manufacturers(manufacturer_id, name) VALUES (?, ?)",
+    "packages": "INSERT INTO packages(package_id, name) VALUES (?, ?)",
+    "attribute_keys": "INSERT INTO attribute_keys(attribute_key_id, name) VALUES (?, ?)",
+    "attribute_templates": "INSERT INTO attribute_templates(attribute_template_id, json) VALUES (?, ?)",
+    "attribute_values": """
+        INSERT INTO attribute_values(attribute_value_id, attribute_template_id, value_json)
+        VALUES (?, ?, ?)
+        """,
+    "components": """
+        INSERT INTO components(
+            component_id, lcsc, category_id, mfr, manufacturer_id, package_id,
+            joints, stock, basic, preferred, discontinued, price_at_moq
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+    "component_details": """
+        INSERT INTO component_details(
+            component_id, description, datasheet, price, img, url, content_hash
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+    "component_fts": """
+        INSERT INTO component_fts(rowid, lcsc, mfr, description)
+        VALUES (?, ?, ?, ?)
+        """,
+    "component_attributes": """
+        INSERT INTO component_attributes(
+            component_id, attribute_key_id, attribute_value_id
+        )
+        VALUES (?, ?, ?)
+        """,
+    "component_numeric_attributes": """
+        INSERT INTO component_numeric_attributes(
+            attribute_key_id, value_name, unit, numeric_value, component_id
+        )
+        VALUES (?, ?, ?, ?, ?)
+        """,
+    "price_breaks": """
+        INSERT INTO price_breaks(component_id, q_from, q_to, unit_price)
+        VALUES (?, ?, ?, ?)
+        """,
+    "component_mpns": "INSERT INTO component_mpns(normalized_mpn, component_id) VALUES (?, ?)",
+}
+
+# WITHOUT ROWID tables a fresh build loads into a scratch DB first, see
+# WebDbBuilder.create_stage
+_STAGED_TABLES = [
+    "component_attributes",
+    "component_numeric_attributes",
+    "price_breaks",
+    "component_mpns",
+]
+
+_STAGED_INSERTS = {
+    table: _INSERTS[table].replace(f"INSERT INTO {table}(", f"INSERT INTO stage.{table}(", 1)
+    for table in _STAGED_TABLES
+}
+
+
+# Lookup tables given by table, id column, value columns and value columns
+# referencing ids of preceding lookup tables
+_LOOKUP_TABLES = [
+    ("categories", "category_id", ["category", "subcategory"], {}),
+    ("manufacturers", "manufacturer_id", ["name"], {}),
+    ("packages", "package_id", ["name"], {}),
+    ("attribute_keys", "attribute_key_id", ["name"], {}),
+    ("attribute_templates", "attribute_template_id", ["json"], {}),
+    ("attribute_values", "attribute_value_id", ["attribute_template_id", "value_json"],
+        {"attribute_template_id": "attribute_templates"}),
+]
+
+
+def _attr_value_key(template_id, value_json):
+    return f"{template_id or ''}:{value_json}"
+
+
+def _partition_categories(counts, task_count):
+    """
+    Split categories given as a dictionary id -> number of components into at
+    most task_count contiguous ranges of ids with similar numbers of
+    components
+    """
+    total = sum(counts.values())
+    target = max(1, total // max(1, task_count))
+    ranges = []
+    first = None
+    size = 0
+    for category_id, count in sorted(counts.items()):
+        if first is None:
+            first = category_id
+        size += count
+        if size >= target:
+            ranges.append((first, category_id))
+            first = None
+            size = 0
+    if first is not None:
+        ranges.append((first, max(counts)))
+    return ranges
+
+
+def _build_partial(source_db, partial_db, category_range, ignoreoldstock, cache_size, batch_size):
+    # The full text and MPN indexes are filled from the merged components
+    builder = WebDbBuilder(
+        source_db=source_db,
+        output_db=partial_db,
+        with_fts=False,
+        with_mpn_index=False,
+        cache_size=cache_size,
+        batch_size=batch_size,
+    )
+    try:
+        with builder.conn:
+            builder.configure()
+            builder.create_schema()
+            builder.insert_components(ignoreoldstock, category_range=category_range)
+    finally:
+        builder.close()
+    return partial_db
+
+
 def _component_row(component, category_id, manufacturer_id, package_id):
     return (
         component["lcsc"],
@@ -60,38 +309,151 @@ def _component_row(component, category_id, manufacturer_id, package_id):
         int(bool(component["basic"])),
         int(bool(component["preferred"])),
         _component_status(component),
+        _priceAtMoq(component),
+    )
+
+
+def _price_json(component):
+    return json.dumps(component["price"], separators=(",", ":"))
+
+
+def _component_detail_row(component):
+    return (
         component["description"],
         component["datasheet"],
-        json.dumps(component["price"], separators=(",", ":")),
+        _price_json(component),
         crushImages(component.get("extra", {}).get("images", None)),
         trimLcscUrl(component.get("extra", {}).get("url", None), component["lcsc"]),
+        _content_hash(component),
     )
 
 
+PRICES_AT_QUANTITY_QUERY = """
+    SELECT c.lcsc, p.unit_price
+    FROM components c
+    LEFT JOIN price_breaks p ON p.component_id = c.component_id
+        AND p.q_from <= :quantity AND (p.q_to IS NULL OR p.q_to >= :quantity)
+    WHERE c.category_id = :category_id
+    ORDER BY p.unit_price IS NULL, p.unit_price, c.lcsc
+    """
+
+MPN_PREFIX_QUERY = """
+    SELECT m.normalized_mpn, c.lcsc
+    FROM component_mpns m JOIN components c USING(component_id)
+    WHERE m.normalized_mpn >= :prefix AND m.normalized_mpn < :prefix || char(1114111)
+    ORDER BY m.normalized_mpn, c.lcsc
+    """
+
+
+def prices_at_quantity(conn, category_id, quantity):
+    """
+    Evaluate unit prices of all components of a category in a web DB at the
+    given quantity in a single query. Return a list of (LCSC code, unit
+    price) ordered by the price; components that cannot be bought in the
+    quantity have price None and go last.
+    """
+    return conn.execute(
+        PRICES_AT_QUANTITY_QUERY, {"category_id": category_id, "quantity": quantity}
+    ).fetchall()
+
+
+def page_layout(conn):
+    """
+    Describe the fragmentation of a web DB: the number of pages, of free
+    pages and of leaf pages of tables and indexes not directly following the
+    previous leaf in key order, i.e., needing a separate read when scanned.
+    Leaf counts are None if SQLite lacks the dbstat table.
+    """
+    layout = {
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "leaf_pages": None,
+        "scattered_leaf_pages": None,
+    }
+    try:
+        # Paths number children by fixed-width hex digits, so leaves of a
+        # tree sort in key order
+        rows = conn.execute(
+            "SELECT name, pageno FROM dbstat WHERE pagetype = 'leaf' ORDER BY name, path"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return layout
+    scattered = 0
+    previous = (None, None)
+    for name, pageno in rows:
+        if name == previous[0] and pageno != previous[1] + 1:
+            scattered += 1
+        previous = (name, pageno)
+    layout["leaf_pages"] = len(rows)
+    layout["scattered_leaf_pages"] = scattered
+    return layout
+
+
+def components_by_mpn_prefix(conn, prefix):
+    """
+    Find components of a web DB built with the MPN index whose normalized MFR
+    number starts with the normalized prefix, e.g., "stm32f103" finds
+    STM32F103C8T6. Return a list of (normalized MFR number, LCSC code).
+    """
+    prefix = normalizeMpn(prefix)
+    if prefix == "":
+        return []
+    # No character encodes greater than U+10FFFF (char(1114111))
+    return conn.execute(MPN_PREFIX_QUERY, {"prefix": prefix}).fetchall()
+
+
 class WebDbBuilder:
-    def __init__(self, source_db, output_db, page_size=4096, with_fts=True):
+    def __init__(self, source_db, output_db, page_size=4096, with_fts=True,
+                 cache_size=CACHE_SIZE_DEFAULT, batch_size=BATCH_SIZE_DEFAULT,
+                 fts_tokenizer="unicode61", with_mpn_index=False):
+        if fts_tokenizer not in FTS_TOKENIZERS:
+            raise ValueError(f"Unknown FTS tokenizer {fts_tokenizer}")
         self.source_db = source_db
         self.output_db = output_db
         self.page_size = page_size
         self.with_fts = with_fts
+        self.fts_tokenizer = fts_tokenizer
+        self.with_mpn_index = with_mpn_index
+        self.batch_size = batch_size
+        # Tables filled only with some options
+        self.optional_tables = {"component_fts": with_fts, "component_mpns": with_mpn_index}
 
         self.src = PartLibraryDb(source_db)
         self.conn = sqlite3.connect(output_db)
         self.conn.row_factory = sqlite3.Row
+        self.conn.create_function(
+            "normalize_mpn", 1, lambda mfr: normalizeMpn(mfr or ""), deterministic=True
+        )
 
+        # Ids of lookup values are assigned here; an update loads the ids of
+        # the previous DB first. The large maps spill to disk past cache_size
+        # entries.
         self.category_cache = {}
-        self.manufacturer_cache = {}
-        self.package_cache = {}
+        self.manufacturer_cache = DiskDict(cacheSize=cache_size)
+        self.package_cache = DiskDict(cacheSize=cache_size)
         self.attr_key_cache = {}
-        self.attr_value_cache = {}
+        self.attr_template_cache = {}
+        self.attr_value_cache = DiskDict(cacheSize=cache_size)
+
+        # Rows waiting for a batch insert, table -> list of rows
+        self.pending = {table: [] for table in _INSERTS}
+        self.pending_deletes = {table: [] for table in _DELETES}
+        self.pending_updates = {table: [] for table in _UPDATES}
+        self.pending_count = 0
+        # Scratch DB of a fresh build, see create_stage
+        self.stage_db = None
 
         self.component_count = 0
         self.attribute_count = 0
+        self.numeric_attribute_count = 0
 
-    def configure(self):
-        self.conn.execute(f"PRAGMA page_size = {int(self.page_size)}")
-        self.conn.execute("PRAGMA journal_mode = OFF")
-        self.conn.execute("PRAGMA synchronous = OFF")
+    def configure(self, update=False):
+        if not update:
+            # A fresh DB is thrown away on failure; an updated one has to
+            # survive it
+            self.conn.execute(f"PRAGMA page_size = {int(self.page_size)}")
+            self.conn.execute("PRAGMA journal_mode = OFF")
+            self.conn.execute("PRAGMA synchronous = OFF")
         self.conn.execute("PRAGMA temp_store = MEMORY")
         self.conn.execute("PRAGMA cache_size = -200000")
         self.conn.execute("PRAGMA locking_mode = EXCLUSIVE")
@@ -101,39 +463,51 @@ class WebDbBuilder:
             """
             DROP TABLE IF EXISTS meta;
             DROP TABLE IF EXISTS component_attributes;
+            DROP TABLE IF EXISTS component_numeric_attributes;
+            DROP TABLE IF EXISTS price_breaks;
             DROP TABLE IF EXISTS attribute_values;
+            DROP TABLE IF EXISTS attribute_templates;
             DROP TABLE IF EXISTS attribute_keys;
+            DROP VIEW IF EXISTS component_search;
+            DROP TABLE IF EXISTS component_details;
             DROP TABLE IF EXISTS components;
             DROP TABLE IF EXISTS categories;
             DROP TABLE IF EXISTS manufacturers;
             DROP TABLE IF EXISTS packages;
             DROP TABLE IF EXISTS component_fts;
+            DROP TABLE IF EXISTS component_mpns;
 
             CREATE TABLE meta (
                 key TEXT PRIMARY KEY NOT NULL,
                 value TEXT NOT NULL
             );
 
+            -- Values of lookup tables and LCSC codes are unique; the unique
+            -- indexes are created after the tables are loaded
             CREATE TABLE categories (
                 category_id INTEGER PRIMARY KEY NOT NULL,
                 category TEXT NOT NULL,
-                subcategory TEXT NOT NULL,
-                UNIQUE(category, subcategory)
+                subcategory TEXT NOT NULL
             );
 
             CREATE TABLE manufacturers (
                 manufacturer_id INTEGER PRIMARY KEY NOT NULL,
-                name TEXT NOT NULL UNIQUE
+                name TEXT NOT NULL
             );
 
             CREATE TABLE packages (
                 package_id INTEGER PRIMARY KEY NOT NULL,
-                name TEXT NOT NULL UNIQUE
+                name TEXT NOT NULL
             );
 
+            -- Components are split into a narrow table of the columns lists
+            -- filter and sort on, so scans of it read few pages, and a
+            -- table of long strings fetched by id for the rows shown.
+            -- price_at_moq is the unit price at the minimum order quantity,
+            -- i.e., of the first price tier, NULL if there is no price.
             CREATE TABLE components (
                 component_id INTEGER PRIMARY KEY NOT NULL,
-                lcsc TEXT NOT NULL UNIQUE,
+                lcsc TEXT NOT NULL,
                 category_id INTEGER NOT NULL REFERENCES categories(category_id),
                 mfr TEXT NOT NULL,
                 manufacturer_id INTEGER REFERENCES manufacturers(manufacturer_id),
@@ -143,21 +517,43 @@ class WebDbBuilder:
                 basic INTEGER NOT NULL,
                 preferred INTEGER NOT NULL,
                 discontinued INTEGER NOT NULL,
+                price_at_moq REAL
+            );
+
+            CREATE TABLE component_details (
+                component_id INTEGER PRIMARY KEY NOT NULL REFERENCES components(component_id),
                 description TEXT NOT NULL,
                 datasheet TEXT NOT NULL,
                 price TEXT NOT NULL,
                 img TEXT,
-                url TEXT
+                url TEXT,
+                content_hash INTEGER NOT NULL
             );
 
+            -- Content of the full text index
+            CREATE VIEW component_search AS
+                SELECT c.component_id, c.lcsc, c.mfr, d.description
+                FROM components c JOIN component_details d USING(component_id);
+
             CREATE TABLE attribute_keys (
                 attribute_key_id INTEGER PRIMARY KEY NOT NULL,
-                name TEXT NOT NULL UNIQUE
+                name TEXT NOT NULL
+            );
+
+            -- A normalized attribute value is split into a template shared
+            -- by many values (format, primary value, names and units of
+            -- values) and a JSON list of the numbers or strings of the
+            -- value; values not fitting a template have no template and
+            -- their JSON is stored whole
+            CREATE TABLE attribute_templates (
+                attribute_template_id INTEGER PRIMARY KEY NOT NULL,
+                json TEXT NOT NULL
             );
 
             CREATE TABLE attribute_values (
                 attribute_value_id INTEGER PRIMARY KEY NOT NULL,
-                json TEXT NOT NULL UNIQUE
+                attribute_template_id INTEGER REFERENCES attribute_templates(attribute_template_id),
+                value_json TEXT NOT NULL
             );
 
             CREATE TABLE component_attributes (
@@ -166,178 +562,309 @@ class WebDbBuilder:
                 attribute_value_id INTEGER NOT NULL REFERENCES attribute_values(attribute_value_id),
                 PRIMARY KEY(component_id, attribute_key_id)
             ) WITHOUT ROWID;
+
+            -- Numeric values of attributes, e.g., the resistance of a
+            -- resistor. The primary key makes the table its own covering
+            -- index for range scans over a value of an attribute.
+            CREATE TABLE component_numeric_attributes (
+                attribute_key_id INTEGER NOT NULL REFERENCES attribute_keys(attribute_key_id),
+                value_name TEXT NOT NULL,
+                unit TEXT NOT NULL,
+                numeric_value REAL NOT NULL,
+                component_id INTEGER NOT NULL REFERENCES components(component_id),
+                PRIMARY KEY(attribute_key_id, value_name, numeric_value, component_id)
+            ) WITHOUT ROWID;
+
+            -- Price tiers of component_details.price; a tier applies to quantities
+            -- from q_from to q_to inclusive, q_to is NULL for the last tier.
+            -- The primary key finds the tier of a quantity by a seek.
+            CREATE TABLE price_breaks (
+                component_id INTEGER NOT NULL REFERENCES components(component_id),
+                q_from INTEGER NOT NULL,
+                q_to INTEGER,
+                unit_price REAL NOT NULL,
+                PRIMARY KEY(component_id, q_from)
+            ) WITHOUT ROWID;
             """
         )
 
         if self.with_fts:
             self.conn.execute(
-                """
+                f"""
                 CREATE VIRTUAL TABLE component_fts USING fts5(
                     lcsc,
                     mfr,
                     description,
-                    content='',
+                    content='component_search',
+                    content_rowid='component_id',
                     columnsize=0,
                     detail='none',
-                    tokenize='unicode61'
+                    tokenize='{self.fts_tokenizer}'
                 )
                 """
             )
 
+        if self.with_mpn_index:
+            self.conn.execute(
+                """
+                CREATE TABLE component_mpns (
+                    normalized_mpn TEXT NOT NULL,
+                    component_id INTEGER NOT NULL REFERENCES components(component_id),
+                    PRIMARY KEY(normalized_mpn, component_id)
+                ) WITHOUT ROWID
+                """
+            )
+
     def get_or_create_category_id(self, category, subcategory):
         key = (category, subcategory)
         category_id = self.category_cache.get(key)
-        if category_id is not None:
-            return category_id
-
-        row = self.conn.execute(
-            "SELECT category_id FROM categories WHERE category = ? AND subcategory = ?",
-            key,
-        ).fetchone()
-        if row is None:
-            cur = self.conn.execute(
-                "INSERT INTO categories(category, subcategory) VALUES (?, ?)",
-                key,
-            )
-            category_id = cur.lastrowid
-        else:
-            category_id = row["category_id"]
-        self.category_cache[key] = category_id
+        if category_id is None:
+            category_id = len(self.category_cache) + 1
+            self.category_cache[key] = category_id
+            self.pending["categories"].append((category_id, category, subcategory))
         return category_id
 
-    def get_or_create_lookup_id(self, table, id_column, value_column, value, cache):
-        if value in cache:
-            return cache[value]
-        row = self.conn.execute(
-            f"SELECT {id_column} FROM {table} WHERE {value_column} = ?",
-            (value,),
-        ).fetchone()
-        if row is None:
-            cur = self.conn.execute(
-                f"INSERT INTO {table}({value_column}) VALUES (?)",
-                (value,),
-            )
-            value_id = cur.lastrowid
-        else:
-            value_id = row[id_column]
-        cache[value] = value_id
+    def get_or_create_lookup_id(self, table, value, cache):
+        value_id = cache.get(value)
+        if value_id is None:
+            value_id = len(cache) + 1
+            cache[value] = value_id
+            self.pending[table].append((value_id, value))
         return value_id
 
     def get_or_create_manufacturer_id(self, name):
         if not name:
             return None
-        return self.get_or_create_lookup_id(
-            "manufacturers",
-            "manufacturer_id",
-            "name",
-            name,
-            self.manufacturer_cache,
-        )
+        return self.get_or_create_lookup_id("manufacturers", name, self.manufacturer_cache)
 
     def get_or_create_package_id(self, package):
         if not package:
             return None
-        return self.get_or_create_lookup_id(
-            "packages",
-            "package_id",
-            "name",
-            package,
-            self.package_cache,
-        )
+        return self.get_or_create_lookup_id("packages", package, self.package_cache)
 
     def get_or_create_attr_key_id(self, name):
-        return self.get_or_create_lookup_id(
-            "attribute_keys",
-            "attribute_key_id",
-            "name",
-            name,
-            self.attr_key_cache,
-        )
+        return self.get_or_create_lookup_id("attribute_keys", name, self.attr_key_cache)
 
-    def get_or_create_attr_value_id(self, value_json):
-        return self.get_or_create_lookup_id(
-            "attribute_values",
-            "attribute_value_id",
-            "json",
-            value_json,
-            self.attr_value_cache,
-        )
+    def get_or_create_attr_value_id(self, value):
+        template, values = splitAttributeValue(value)
+        template_id = None
+        if template is not None:
+            template_id = self.get_or_create_lookup_id(
+                "attribute_templates",
+                json.dumps(template, sort_keys=True, separators=(",", ":")),
+                self.attr_template_cache,
+            )
+        value_json = json.dumps(values, sort_keys=True, separators=(",", ":"))
+        key = _attr_value_key(template_id, value_json)
+        value_id = self.attr_value_cache.get(key)
+        if value_id is None:
+            value_id = len(self.attr_value_cache) + 1
+            self.attr_value_cache[key] = value_id
+            self.pending["attribute_values"].append((value_id, template_id, value_json))
+        return value_id
 
     def insert_component(self, component_id, component):
+        """
+        Queue a component for insertion; rows are written by flush in batches
+        """
         category_id = self.get_or_create_category_id(
             component["category"], component["subcategory"]
         )
         manufacturer_id = self.get_or_create_manufacturer_id(component.get("manufacturer", ""))
         package_id = self.get_or_create_package_id(component.get("package", ""))
 
-        self.conn.execute(
-            """
-            INSERT INTO components(
-                component_id, lcsc, category_id, mfr, manufacturer_id, package_id,
-                joints, stock, basic, preferred, discontinued, description,
-                datasheet, price, img, url
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (component_id,) + _component_row(component, category_id, manufacturer_id, package_id),
+        self.pending["components"].append(
+            (component_id,) + _component_row(component, category_id, manufacturer_id, package_id)
         )
-
-        if self.with_fts:
-            self.conn.execute(
-                """
-                INSERT INTO component_fts(rowid, lcsc, mfr, description)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    component_id,
-                    component["lcsc"],
-                    component["mfr"],
-                    component["description"],
-                ),
+        self.pending["component_details"].append((component_id,) + _component_detail_row(component))
+        # A fresh build fills the full text index at once in finalize
+        if self.with_fts and self.stage_db is None:
+            self.pending["component_fts"].append(
+                (component_id, component["lcsc"], component["mfr"], component["description"])
             )
+        if self.with_mpn_index:
+            normalized_mpn = normalizeMpn(component["mfr"] or "")
+            if normalized_mpn != "":
+                self.pending["component_mpns"].append((normalized_mpn, component_id))
 
-        attr_rows = []
         for key, value in _normalized_attributes(component).items():
             attr_key_id = self.get_or_create_attr_key_id(key)
-            attr_value_json = json.dumps(value, sort_keys=True, separators=(",", ":"))
-            attr_value_id = self.get_or_create_attr_value_id(attr_value_json)
-            attr_rows.append((component_id, attr_key_id, attr_value_id))
-
-        if attr_rows:
-            self.conn.executemany(
-                """
-                INSERT INTO component_attributes(
-                    component_id, attribute_key_id, attribute_value_id
+            attr_value_id = self.get_or_create_attr_value_id(value)
+            self.pending["component_attributes"].append((component_id, attr_key_id, attr_value_id))
+            self.attribute_count += 1
+            for value_name, unit, number in _numeric_values(value):
+                self.pending["component_numeric_attributes"].append(
+                    (attr_key_id, value_name, unit, number, component_id)
                 )
-                VALUES (?, ?, ?)
-                """,
-                attr_rows,
+                self.numeric_attribute_count += 1
+
+        for q_from, q_to, unit_price in _price_breaks(component):
+            self.pending["price_breaks"].append((component_id, q_from, q_to, unit_price))
+
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def delete_component(self, component_id):
+        """
+        Queue removal of a component; rows are deleted by flush in batches
+        """
+        for table in _DELETES:
+            if self.optional_tables.get(table, True):
+                self.pending_deletes[table].append((component_id,))
+
+    def update_stock(self, component_id, component):
+        """
+        Queue an update of the stock and price of a component whose other
+        fields didn't change; the rows are updated in place by flush
+        """
+        self.pending_updates["components"].append(
+            (int(component["stock"]), _priceAtMoq(component), component_id)
+        )
+        self.pending_updates["component_details"].append((_price_json(component), component_id))
+        self.pending_deletes["price_breaks"].append((component_id,))
+        for q_from, q_to, unit_price in _price_breaks(component):
+            self.pending["price_breaks"].append((component_id, q_from, q_to, unit_price))
+
+        self.pending_count += 1
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all queued rows
+        """
+        for table, statement in _DELETES.items():
+            rows = self.pending_deletes[table]
+            if rows:
+                self.conn.executemany(statement, rows)
+                rows.clear()
+        for table, statement in _UPDATES.items():
+            rows = self.pending_updates[table]
+            if rows:
+                self.conn.executemany(statement, rows)
+                rows.clear()
+        for table, statement in _INSERTS.items():
+            rows = self.pending[table]
+            if rows:
+                if self.stage_db is not None:
+                    statement = _STAGED_INSERTS.get(table, statement)
+                self.conn.executemany(statement, rows)
+                rows.clear()
+        self.pending_count = 0
+
+    def create_stage(self):
+        """
+        Create a scratch DB next to the output holding copies of the WITHOUT
+        ROWID tables for a fresh build. Rows inserted into a b-tree keyed
+        otherwise than by rowid leave its pages partly empty and, as all
+        tables grow at once, the pages of a table end up scattered over the
+        file. load_staged copies the finished tables one by one; a copy of
+        an identical table appends the rows in key order, so the output is
+        written densely in its final order and needs no VACUUM.
+        """
+        fd, self.stage_db = tempfile.mkstemp(
+            suffix=".stage.sqlite3", dir=os.path.dirname(os.path.abspath(self.output_db))
+        )
+        os.close(fd)
+        self.conn.execute("ATTACH DATABASE ? AS stage", (self.stage_db,))
+        cache_size, = self.conn.execute("PRAGMA main.cache_size").fetchone()
+        self.conn.execute(f"PRAGMA stage.cache_size = {cache_size}")
+        self.conn.execute("PRAGMA stage.journal_mode = OFF")
+        self.conn.execute("PRAGMA stage.synchronous = OFF")
+        for table in self.staged_tables():
+            sql, = self.conn.execute(
+                "SELECT sql FROM main.sqlite_schema WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            self.conn.execute(sql.replace(f"CREATE TABLE {table}", f"CREATE TABLE stage.{table}", 1))
+
+    def staged_tables(self):
+        return [table for table in _STAGED_TABLES if self.optional_tables.get(table, True)]
+
+    def drop_stage(self):
+        if self.stage_db is None:
+            return
+        self.conn.commit()
+        self.conn.execute("DETACH DATABASE stage")
+        os.unlink(self.stage_db)
+        self.stage_db = None
+
+    def load_staged(self):
+        """
+        Copy the staged tables of a fresh build to the output and fill the
+        full text index
+        """
+        for table in self.staged_tables():
+            # SQLite copies rows of an identical table into an empty one in
+            # order of the key without sorting them
+            self.conn.execute(f"INSERT INTO main.{table} SELECT * FROM stage.{table}")
+        self.drop_stage()
+        if self.with_fts:
+            # The index is built from the content in a single pass
+            self.conn.execute("INSERT INTO component_fts(component_fts) VALUES ('rebuild')")
+        self.conn.commit()
+
+    def create_lookup_indexes(self):
+        self.conn.executescript(
+            "".join(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_values ON {table}({', '.join(columns)});"
+                for table, _, columns, _ in _LOOKUP_TABLES
             )
-            self.attribute_count += len(attr_rows)
+        )
 
-    def finalize(self, started_at):
+    def finalize(self, started_at, update=False):
+        if not update:
+            self.load_staged()
+        # All indexes are created after the tables are loaded, so they are
+        # built from sorted input in adjacent pages.
+        self.create_lookup_indexes()
+        # Filters are combined with the category almost always. The category
+        # index lists components of a category in the order of the table, so
+        # joins on them read adjacent pages; the composite indexes answer
+        # counts and existence checks by themselves and list components by
+        # price without sorting them. Attributes of a component are found by
+        # the primary key of component_attributes.
         self.conn.executescript(
             """
-            CREATE INDEX components_category_id ON components(category_id);
-            CREATE INDEX components_stock ON components(stock);
-            CREATE INDEX components_manufacturer_id ON components(manufacturer_id);
-            CREATE INDEX components_package_id ON components(package_id);
-            CREATE INDEX component_attributes_key_value
+            CREATE UNIQUE INDEX IF NOT EXISTS components_lcsc ON components(lcsc);
+            CREATE INDEX IF NOT EXISTS components_category_id ON components(category_id);
+            CREATE INDEX IF NOT EXISTS components_category_stock ON components(category_id, stock);
+            CREATE INDEX IF NOT EXISTS components_category_price ON components(category_id, price_at_moq);
+            CREATE INDEX IF NOT EXISTS components_stock ON components(stock);
+            CREATE INDEX IF NOT EXISTS components_manufacturer_category
+                ON components(manufacturer_id, category_id);
+            CREATE INDEX IF NOT EXISTS components_package_category
+                ON components(package_id, category_id);
+            CREATE INDEX IF NOT EXISTS component_attributes_key_value
                 ON component_attributes(attribute_key_id, attribute_value_id, component_id);
-            CREATE INDEX component_attributes_component_id
-                ON component_attributes(component_id);
+            CREATE INDEX IF NOT EXISTS component_numeric_attributes_component_id
+                ON component_numeric_attributes(component_id);
             """
         )
 
-        self.conn.execute("ANALYZE")
-        self.conn.execute("VACUUM")
+        if update:
+            # Statistics are refreshed only where they drifted; freed pages
+            # are reused by the next update
+            self.conn.execute("PRAGMA optimize")
+        else:
+            # The file was written in order and is not rewritten by VACUUM;
+            # what fragmentation remains is reported by page_layout. Sampled
+            # statistics lead the planner to the same indexes at a fraction
+            # of the cost of a full ANALYZE.
+            self.conn.execute("PRAGMA analysis_limit = 1000")
+            self.conn.execute("ANALYZE")
 
+        layout = page_layout(self.conn)
         elapsed = time.monotonic() - started_at
         output_size = os.path.getsize(self.output_db)
         meta = {
             "source_db": self.source_db,
             "components": str(self.component_count),
             "component_attributes": str(self.attribute_count),
+            "component_numeric_attributes": str(self.numeric_attribute_count),
+            "price_breaks": str(
+                self.conn.execute("SELECT COUNT(*) FROM price_breaks").fetchone()[0]
+            ),
             "categories": str(
                 self.conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0]
             ),
@@ -350,62 +877,341 @@ class WebDbBuilder:
             "attribute_keys": str(
                 self.conn.execute("SELECT COUNT(*) FROM attribute_keys").fetchone()[0]
             ),
+            "attribute_templates": str(
+                self.conn.execute("SELECT COUNT(*) FROM attribute_templates").fetchone()[0]
+            ),
             "attribute_values": str(
                 self.conn.execute("SELECT COUNT(*) FROM attribute_values").fetchone()[0]
             ),
             "with_fts": "1" if self.with_fts else "0",
-            "page_size": str(self.page_size),
+            "fts_tokenizer": self.fts_tokenizer,
+            "fts_query": FTS_QUERIES[self.fts_tokenizer] if self.with_fts else "",
+            "mpn_index": "1" if self.with_mpn_index else "0",
+            "page_size": str(self.conn.execute("PRAGMA page_size").fetchone()[0]),
+            "schema_version": str(SCHEMA_VERSION),
+            "builder_salt": _builder_salt(),
             "build_seconds": f"{elapsed:.2f}",
             "output_bytes": str(output_size),
         }
+        meta.update((key, str(value)) for key, value in layout.items() if value is not None)
         self.conn.executemany(
-            "INSERT INTO meta(key, value) VALUES (?, ?)",
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
             list(meta.items()),
         )
         self.conn.commit()
+        return layout
+
+    def insert_components(self, ignoreoldstock=None, limit=None, verbose=False, category_range=None):
+        # Components come ordered by category and LCSC and get ascending ids.
+        # As the id is the rowid of components and leads the keys of all
+        # per-component tables, the rows of a category are stored in
+        # adjacent pages, so a remote reader fetches few of them.
+        component_id = self.component_count + 1
+        components = self.src.iterComponentsByCategory(
+            stockNewerThan=ignoreoldstock,
+            fetchSize=self.batch_size,
+            categoryRange=category_range,
+        )
+        for component in components:
+            if limit is not None and self.component_count >= limit:
+                break
+            if component["category"] is None:
+                continue
+            self.insert_component(component_id, component)
+            component_id += 1
+            self.component_count += 1
+            if verbose and self.pending_count == 0:
+                print(f"{self.component_count} components, {self.attribute_count} attributes")
+        self.flush()
+        self.conn.commit()
+
+    def merge_partial(self, partial_db):
+        """
+        Append a partial DB built for the following categories. Lookup values
+        new to this DB get ids in the order the partial assigned them, which
+        is the order of their first use; component ids continue after the
+        existing ones. The result is thus the same as if the components of
+        the partial were inserted here. The full text index is filled after
+        all partials are merged.
+        """
+        self.conn.commit()
+        self.conn.execute("ATTACH DATABASE ? AS part", (partial_db,))
+        offset = self.component_count
+        for table, id_column, value_columns, references in _LOOKUP_TABLES:
+            # Values may be NULL, IS compares them as equal
+            join = " AND ".join(f"t.{x} IS p.{x}" for x in value_columns)
+            columns = ", ".join(value_columns)
+            source = f"part.{table}"
+            if references:
+                # Translate references to ids of this DB first
+                selected = ", ".join(
+                    f"m_{x}.new AS {x}" if x in references else f"q.{x}"
+                    for x in [id_column] + value_columns
+                )
+                joins = " ".join(
+                    f"LEFT JOIN temp.map_{ref} m_{x} ON m_{x}.old = q.{x}"
+                    for x, ref in references.items()
+                )
+                source = f"(SELECT {selected} FROM part.{table} q {joins})"
+            self.conn.executescript(f"""
+                INSERT INTO main.{table}({columns})
+                    SELECT {columns} FROM {source} p
+                    WHERE NOT EXISTS (SELECT 1 FROM main.{table} t WHERE {join})
+                    ORDER BY p.{id_column};
+                CREATE TEMP TABLE map_{table} (old INTEGER PRIMARY KEY, new INTEGER NOT NULL);
+                INSERT INTO temp.map_{table}(old, new)
+                    SELECT p.{id_column}, t.{id_column}
+                    FROM {source} p JOIN main.{table} t ON {join};
+                """)
+        self.conn.execute(
+            """
+            INSERT INTO main.components
+                SELECT c.component_id + ?, c.lcsc, mc.new, c.mfr, mm.new, mp.new,
+                    c.joints, c.stock, c.basic, c.preferred, c.discontinued, c.price_at_moq
+                FROM part.components c
+                JOIN temp.map_categories mc ON mc.old = c.category_id
+                LEFT JOIN temp.map_manufacturers mm ON mm.old = c.manufacturer_id
+                LEFT JOIN temp.map_packages mp ON mp.old = c.package_id
+                ORDER BY c.component_id
+            """,
+            (offset,),
+        )
+        self.conn.execute(
+            """
+            INSERT INTO main.component_details
+                SELECT component_id + ?, description, datasheet, price, img, url, content_hash
+                FROM part.component_details ORDER BY component_id
+            """,
+            (offset,),
+        )
+        self.conn.execute(
+            """
+            INSERT INTO stage.component_attributes
+                SELECT a.component_id + ?, mk.new, mv.new
+                FROM part.component_attributes a
+                JOIN temp.map_attribute_keys mk ON mk.old = a.attribute_key_id
+                JOIN temp.map_attribute_values mv ON mv.old = a.attribute_value_id
+            """,
+            (offset,),
+        )
+        self.conn.execute(
+            """
+            INSERT INTO stage.component_numeric_attributes
+                SELECT mk.new, n.value_name, n.unit, n.numeric_value, n.component_id + ?
+                FROM part.component_numeric_attributes n
+                JOIN temp.map_attribute_keys mk ON mk.old = n.attribute_key_id
+            """,
+            (offset,),
+        )
+        self.conn.execute(
+            """
+            INSERT INTO stage.price_breaks
+                SELECT component_id + ?, q_from, q_to, unit_price
+                FROM part.price_breaks ORDER BY component_id, q_from
+            """,
+            (offset,),
+        )
+        if self.with_mpn_index:
+            self.conn.execute(
+                """
+                INSERT INTO stage.component_mpns(normalized_mpn, component_id)
+                    SELECT normalize_mpn(mfr), component_id + ?
+                    FROM part.components WHERE normalize_mpn(mfr) != ''
+                """,
+                (offset,),
+            )
+        self.component_count += self.conn.execute(
+            "SELECT COUNT(*) FROM part.components").fetchone()[0]
+        self.attribute_count += self.conn.execute(
+            "SELECT COUNT(*) FROM part.component_attributes").fetchone()[0]
+        self.numeric_attribute_count += self.conn.execute(
+            "SELECT COUNT(*) FROM part.component_numeric_attributes").fetchone()[0]
+        self.conn.commit()
+        for table, _, _, _ in _LOOKUP_TABLES:
+            self.conn.execute(f"DROP TABLE temp.map_{table}")
+        self.conn.execute("DETACH DATABASE part")
+
+    def updatable(self):
+        """
+        Tell whether the output DB was built by this version of the builder
+        with the same options, so it can be updated in place
+        """
+        try:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        except sqlite3.DatabaseError:
+            return False
+        return (meta.get("schema_version") == str(SCHEMA_VERSION)
+                and meta.get("builder_salt") == _builder_salt()
+                and meta.get("with_fts") == ("1" if self.with_fts else "0")
+                and meta.get("fts_tokenizer") == self.fts_tokenizer
+                and meta.get("mpn_index") == ("1" if self.with_mpn_index else "0"))
+
+    def load_lookup_ids(self):
+        """
+        Fill the lookup caches with the ids of the output DB, so new values
+        continue its numbering
+        """
+        caches = {
+            "categories": (self.category_cache, tuple),
+            "manufacturers": (self.manufacturer_cache, lambda row: row[0]),
+            "packages": (self.package_cache, lambda row: row[0]),
+            "attribute_keys": (self.attr_key_cache, lambda row: row[0]),
+            "attribute_templates": (self.attr_template_cache, lambda row: row[0]),
+            "attribute_values": (self.attr_value_cache, lambda row: _attr_value_key(*row)),
+        }
+        for table, id_column, value_columns, _ in _LOOKUP_TABLES:
+            cache, key = caches[table]
+            columns = ", ".join(value_columns)
+            for row in self.conn.execute(
+                    f"SELECT {id_column}, {columns} FROM {table} ORDER BY {id_column}"):
+                cache[key(row[1:])] = row[0]
+
+    def update_components(self, ignoreoldstock=None, verbose=False):
+        """
+        Bring the components of the output DB in line with the source library.
+        Components are matched by LCSC code; a changed one is replaced under
+        its original id, so only the rows of changed components are touched.
+        If only the stock or price of a component changed, these are updated
+        in place. New components are appended after all others, out of the
+        category order of a full build.
+        Return the numbers of inserted, updated, restocked (stock or price
+        changes only) and deleted components.
+        """
+        # LCSC code -> [component id, content hash, stock hash] of components
+        # not seen yet
+        existing = DiskDict(cacheSize=self.manufacturer_cache.cacheSize)
+        for row in self.conn.execute(
+            """
+            SELECT c.lcsc, c.component_id, d.content_hash, c.stock, d.price
+            FROM components c JOIN component_details d USING(component_id)
+            """
+        ):
+            existing[row[0]] = [row[1], row[2], _stock_hash(row[3], row[4])]
+        next_id = self.conn.execute(
+            "SELECT COALESCE(MAX(component_id), 0) + 1 FROM components").fetchone()[0]
+
+        inserted = updated = restocked = 0
+        components = self.src.iterComponentsByCategory(
+            stockNewerThan=ignoreoldstock, fetchSize=self.batch_size
+        )
+        for component in components:
+            if component["category"] is None:
+                continue
+            previous = existing.get(component["lcsc"])
+            if previous is None:
+                self.insert_component(next_id, component)
+                next_id += 1
+                inserted += 1
+            else:
+                del existing[component["lcsc"]]
+                component_id, content_hash, stock_hash = previous
+                if content_hash != _content_hash(component):
+                    self.delete_component(component_id)
+                    self.insert_component(component_id, component)
+                    updated += 1
+                elif stock_hash != _stock_hash(int(component["stock"]), _price_json(component)):
+                    self.update_stock(component_id, component)
+                    restocked += 1
+                else:
+                    continue
+            if verbose and self.pending_count == 0:
+                print(f"{inserted} inserted, {updated} updated, {restocked} restocked")
+
+        deleted = 0
+        for component_id, _, _ in existing.values():
+            self.delete_component(component_id)
+            deleted += 1
+            if deleted % self.batch_size == 0:
+                self.flush()
+        existing.close()
+        self.flush()
+        self.conn.commit()
+        return inserted, updated, restocked, deleted
+
+    def update(self, ignoreoldstock=None, verbose=False):
+        """
+        Update the output DB in place; it has to be updatable. Return its
+        page_layout.
+        """
+        started_at = time.monotonic()
+
+        with self.conn:
+            self.configure(update=True)
+            self.load_lookup_ids()
+            inserted, updated, restocked, deleted = self.update_components(ignoreoldstock, verbose)
+            self.component_count = self.conn.execute(
+                "SELECT COUNT(*) FROM components").fetchone()[0]
+            self.attribute_count = self.conn.execute(
+                "SELECT COUNT(*) FROM component_attributes").fetchone()[0]
+            self.numeric_attribute_count = self.conn.execute(
+                "SELECT COUNT(*) FROM component_numeric_attributes").fetchone()[0]
+            if verbose:
+                print(f"{inserted} inserted, {updated} updated, {restocked} restocked, {deleted} deleted")
+
+        return self.finalize(started_at, update=True)
 
-    def build(self, ignoreoldstock=None, limit=None, verbose=False):
+    def build(self, ignoreoldstock=None, limit=None, verbose=False, jobs=1):
+        """
+        Build the output DB from scratch; return its page_layout
+        """
         started_at = time.monotonic()
-        component_id = 1
 
         with self.conn:
             self.configure()
             self.create_schema()
+            self.create_stage()
+            if jobs > 1:
+                self.build_parallel(ignoreoldstock, jobs, verbose)
+            else:
+                self.insert_components(ignoreoldstock, limit, verbose)
 
-            categories = self.src.categories()
-            for category, subcategories in categories.items():
-                for subcategory in subcategories:
-                    components = self.src.getCategoryComponents(
-                        category,
-                        subcategory,
-                        stockNewerThan=ignoreoldstock,
-                    )
-                    if not components:
-                        continue
-
-                    for component in components:
-                        self.insert_component(component_id, component)
-                        component_id += 1
-                        self.component_count += 1
-                        if limit is not None and self.component_count >= limit:
-                            break
-
-                    if verbose:
-                        print(
-                            f"{self.component_count} components, {self.attribute_count} attributes"
-                        )
-                    self.conn.commit()
-
-                    if limit is not None and self.component_count >= limit:
-                        break
-                if limit is not None and self.component_count >= limit:
-                    break
-
-        self.finalize(started_at)
+        return self.finalize(started_at)
+
+    def build_parallel(self, ignoreoldstock, jobs, verbose):
+        """
+        Build partial DBs for contiguous runs of categories in worker
+        processes and merge them in order
+        """
+        tasks = _partition_categories(
+            self.src.countComponentsByCategory(stockNewerThan=ignoreoldstock), jobs * 4
+        )
+        # Merges look up values of partials in the lookup tables
+        self.create_lookup_indexes()
+        output_dir = os.path.dirname(os.path.abspath(self.output_db))
+        with tempfile.TemporaryDirectory(dir=output_dir) as tmpdir, \
+                ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    _build_partial,
+                    self.source_db,
+                    os.path.join(tmpdir, f"part-{i}.sqlite3"),
+                    category_range,
+                    ignoreoldstock,
+                    self.manufacturer_cache.cacheSize,
+                    self.batch_size,
+                )
+                for i, category_range in enumerate(tasks)
+            ]
+            for future in futures:
+                partial_db = future.result()
+                self.merge_partial(partial_db)
+                os.unlink(partial_db)
+                if verbose:
+                    print(f"{self.component_count} components, {self.attribute_count} attributes")
 
     def close(self):
         self.src.close()
         self.conn.close()
+        if self.stage_db is not None:
+            os.unlink(self.stage_db)
+            self.stage_db = None
+
+
+def _print_layout(output, layout):
+    message = f"{output}: {layout['page_count']} pages, {layout['free_pages']} free"
+    if layout["leaf_pages"] is not None:
+        message += f", {layout['scattered_leaf_pages']} of {layout['leaf_pages']} leaf pages out of order"
+    print(message)
 
 
 @click.command()
@@ -434,23 +1240,87 @@ class WebDbBuilder:
     is_flag=True,
     help="Skip the full text index to reduce build time and size",
 )
+@click.option(
+    "--fts-tokenizer",
+    type=click.Choice(FTS_TOKENIZERS),
+    default="unicode61",
+    show_default=True,
+    help="Tokenizer of the full text index; trigram answers substring queries (LIKE '%STM32F1%') over MFR numbers at the cost of a larger index. "
+         "A trigram index is queried by LIKE or GLOB only, MATCH fails; meta fts_query tells 'match' or 'like'",
+)
+@click.option(
+    "--mpn-index",
+    is_flag=True,
+    help="Add an index of normalized MFR numbers for prefix lookups",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    default=CACHE_SIZE_DEFAULT,
+    show_default=True,
+    help="Number of lookup ids (manufacturers, packages, attribute values) kept in memory; the rest is spilled to a temporary file",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=BATCH_SIZE_DEFAULT,
+    show_default=True,
+    help="Number of components inserted in a single batch",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of worker processes building parts of the DB in parallel",
+)
+@click.option(
+    "--update",
+    is_flag=True,
+    help="Update OUTPUT built by a previous run in place; it is rebuilt if it was built by a different version or with different options",
+)
 @click.option("--verbose", is_flag=True, help="Be verbose")
-def buildwebdb(library, output, ignoreoldstock, limit, page_size, no_fts, verbose):
+def buildwebdb(library, output, ignoreoldstock, limit, page_size, no_fts, fts_tokenizer,
+               mpn_index, cache_size, batch_size, jobs, update, verbose):
     """
     Build a frontend-oriented SQLite database out of LIBRARY and save it to OUTPUT.
     """
+    if jobs > 1 and limit is not None:
+        raise click.UsageError("--limit cannot be combined with --jobs")
+    if update and limit is not None:
+        raise click.UsageError("--limit cannot be combined with --update")
     output_path = Path(output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def make_builder():
+        return WebDbBuilder(
+            source_db=library,
+            output_db=output,
+            page_size=page_size,
+            with_fts=not no_fts,
+            cache_size=cache_size,
+            batch_size=batch_size,
+            fts_tokenizer=fts_tokenizer,
+            with_mpn_index=mpn_index,
+        )
+
+    if update and output_path.exists():
+        builder = make_builder()
+        try:
+            if builder.updatable():
+                _print_layout(output, builder.update(ignoreoldstock=ignoreoldstock, verbose=verbose))
+                return
+        finally:
+            builder.close()
+        print(f"{output} cannot be updated, rebuilding it")
+
     if output_path.exists():
         output_path.unlink()
 
-    builder = WebDbBuilder(
-        source_db=library,
-        output_db=output,
-        page_size=page_size,
-        with_fts=not no_fts,
-    )
+    builder = make_builder()
     try:
-        builder.build(ignoreoldstock=ignoreoldstock, limit=limit, verbose=verbose)
+        _print_layout(
+            output, builder.build(ignoreoldstock=ignoreoldstock, limit=limit, verbose=verbose, jobs=jobs)
+        )
     finally:
         builder.close()
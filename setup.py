@@ -26,6 +26,10 @@ setuptools.setup(
         "click",
         "lxml"
     ],
+    extras_require={
+        "br": ["brotli"],
+        "zstd": ["zstandard"],
+    },
     setup_requires=[
 
     ],
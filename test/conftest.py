@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from jlcparts.partLib import PartLibraryDb, loadJlcTableLazy
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def add_test_parts(library_path, csv_name="testParts.csv"):
+    """
+    Add the parts of a JLC table in the test directory to a library the way
+    getlibrary adds new parts
+    """
+    lib = PartLibraryDb(library_path)
+    with lib.startTransaction():
+        with open(os.path.join(TEST_DIR, csv_name), newline="") as f:
+            for component in loadJlcTableLazy(f):
+                component["extra"] = {}
+                lib.addComponent(component)
+    lib.close()
+
+
+@pytest.fixture
+def library(tmp_path):
+    """
+    Path to a component library holding the parts of testParts.csv
+    """
+    path = str(tmp_path / "library.sqlite3")
+    add_test_parts(path)
+    return path
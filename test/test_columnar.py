@@ -0,0 +1,55 @@
+import pytest
+
+from jlcparts import columnar
+
+
+COLUMNS = [
+    ("lcsc", columnar.LCSC_DELTA, ["C25725", "C25726", "C1", "C1", "C2040000"]),
+    ("mfr", columnar.STRING_DICT, ["4D02WGJ0103TCE", None, "", "4D02WGJ0103TCE", "ÚČ ±5% 10kΩ"]),
+    ("joints", columnar.INT, [8, None, 0, -3, 2**40]),
+    ("attributes", columnar.INT_LISTS, [[0, 1, 2], [], [300, 0, 2**35], [], [7]]),
+    ("price", columnar.PRICE_TIERS, [
+        [[1, 199, 0.005210145], [200, None, 0.001866667]],
+        [],
+        [[10, None, 1.5]],
+        [[1, 9, 0.1], [10, 99, 0.09], [100, None, 0.0]],
+        [],
+    ]),
+]
+
+
+def test_roundtrip_all_encodings():
+    data = columnar.encodeTable(COLUMNS, 5)
+    decoded = columnar.decodeTable(data)
+    assert list(decoded) == [name for name, _, _ in COLUMNS]
+    for name, _, values in COLUMNS:
+        assert decoded[name] == values
+
+
+def test_roundtrip_selected_columns():
+    data = columnar.encodeTable(COLUMNS, 5)
+    decoded = columnar.decodeTable(data, columns=["price", "lcsc"])
+    assert decoded == {"lcsc": COLUMNS[0][2], "price": COLUMNS[4][2]}
+
+
+def test_roundtrip_empty_table():
+    columns = [(name, encoding, []) for name, encoding, _ in COLUMNS]
+    decoded = columnar.decodeTable(columnar.encodeTable(columns, 0))
+    assert decoded == {name: [] for name, _, _ in COLUMNS}
+
+
+def test_table_rows():
+    decoded = columnar.decodeTable(columnar.encodeTable(COLUMNS, 5))
+    rows = columnar.tableRows(decoded, {"price": 1, "lcsc": 0})
+    assert rows[1] == ["C25726", []]
+    assert rows[2] == ["C1", [[10, None, 1.5]]]
+
+
+def test_mismatched_row_count():
+    with pytest.raises(ValueError):
+        columnar.encodeTable(COLUMNS, 4)
+
+
+def test_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        columnar.decodeTable(b"\x1f\x8b" + bytes(10))
@@ -0,0 +1,82 @@
+from jlcparts.diskdict import DiskDict, DiskMultiMap, LruCache
+
+
+def test_diskdict_in_memory():
+    d = DiskDict({"b": 2, "a": 1}.items(), cacheSize=10)
+    d["c"] = [3]
+    assert not d.spilled
+    assert len(d) == 3
+    assert d["a"] == 1 and d["c"] == [3]
+    assert list(d.items()) == [("a", 1), ("b", 2), ("c", [3])]
+    d.close()
+
+
+def test_diskdict_eviction_and_write_back():
+    d = DiskDict(cacheSize=10)
+    for i in range(100):
+        d[i] = {"value": i}
+    assert d.spilled
+    assert len(d.cache) <= 10
+    assert len(d) == 100
+    # Evicted items are read back from the disk
+    assert d[0] == {"value": 0}
+    assert 5 in d and 100 not in d
+
+    # Modified items are written back when they are evicted again
+    for i in range(0, 100, 2):
+        d[i] = {"value": -i}
+    for i in range(100, 150):
+        d[i] = {"value": i}
+    assert len(d) == 150
+    assert all(d[i] == {"value": -i if i % 2 == 0 and i < 100 else i} for i in range(150))
+
+    # Modified items still in the cache are written before iterating
+    d[149] = "last"
+    items = list(d.items())
+    assert [key for key, _ in items] == list(range(150))
+    assert items[149] == (149, "last")
+    d.close()
+
+
+def test_diskdict_delete_and_spill():
+    d = DiskDict(((f"k{i:03d}", i) for i in range(50)), cacheSize=5)
+    del d["k000"]
+    del d["k049"]
+    d["k010"] = "changed"
+    d.spill()
+    assert len(d.cache) == 0
+    assert len(d) == 48
+    assert "k000" not in d and "k049" not in d
+    assert d["k010"] == "changed"
+    assert list(d)[:2] == ["k001", "k002"]
+    d.close()
+
+    # A dictionary still in memory keeps its items when spilled
+    d = DiskDict({"a": 1}.items(), cacheSize=5)
+    d.spill()
+    assert d.spilled and len(d.cache) == 0
+    assert d["a"] == 1 and len(d) == 1
+    d.close()
+
+
+def test_diskmultimap_keeps_insertion_order_after_spilling():
+    m = DiskMultiMap(bufferSize=4)
+    for i in range(20):
+        m.add(f"k{i % 3}", i)
+    assert m.spilled
+    assert list(m.groups()) == [
+        ("k0", list(range(0, 20, 3))),
+        ("k1", list(range(1, 20, 3))),
+        ("k2", list(range(2, 20, 3))),
+    ]
+    m.close()
+
+
+def test_lru_cache_drops_least_recently_used():
+    cache = LruCache(maxSize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache["a"] == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert set(cache) == {"a", "c"}
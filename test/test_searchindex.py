@@ -0,0 +1,10 @@
+from jlcparts.searchindex import normalizeMpn
+
+
+def test_normalize_mpn_keeps_ascii_alphanumerics_only():
+    # Has to match normalizeMpn in web/src/db.js
+    assert normalizeMpn("LM358DR-2G") == "lm358dr2g"
+    assert normalizeMpn("lm358dr_2g ") == "lm358dr2g"
+    assert normalizeMpn("10kΩ ±5%") == "10k5"
+    assert normalizeMpn("Straße") == "strae"
+    assert normalizeMpn("ＡＢＣ１２") == ""
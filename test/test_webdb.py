@@ -0,0 +1,175 @@
+import json
+import sqlite3
+
+import pytest
+
+from jlcparts.webdb import WebDbBuilder
+
+# Meta entries describing the build rather than the content
+VOLATILE_META = {"build_seconds", "output_bytes", "page_count", "free_pages",
+                 "leaf_pages", "scattered_leaf_pages"}
+
+
+def build_web_db(library, output, jobs=1, **options):
+    builder = WebDbBuilder(library, output, **options)
+    try:
+        builder.build(jobs=jobs)
+    finally:
+        builder.close()
+
+
+def update_web_db(library, output, **options):
+    builder = WebDbBuilder(library, output, **options)
+    try:
+        assert builder.updatable()
+        builder.update(verbose=True)
+    finally:
+        builder.close()
+
+
+def table_contents(path):
+    """
+    Return all rows of all tables of a DB as a dictionary table -> rows
+    """
+    conn = sqlite3.connect(path)
+    try:
+        tables = [name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+        contents = {table: sorted(conn.execute(f'SELECT * FROM "{table}"'), key=repr)
+                    for table in tables}
+    finally:
+        conn.close()
+    contents["meta"] = [row for row in contents["meta"] if row[0] not in VOLATILE_META]
+    return contents
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"with_mpn_index": True, "fts_tokenizer": "trigram"},
+])
+def test_parallel_build_matches_serial(library, tmp_path, options):
+    serial = str(tmp_path / "serial.sqlite3")
+    parallel = str(tmp_path / "parallel.sqlite3")
+    build_web_db(library, serial, jobs=1, **options)
+    build_web_db(library, parallel, jobs=4, **options)
+
+    expected = table_contents(serial)
+    actual = table_contents(parallel)
+    assert expected["components"] and expected["component_attributes"]
+    assert list(actual) == list(expected)
+    for table in expected:
+        assert actual[table] == expected[table], table
+
+
+def component_contents(path):
+    """
+    Return the content of a web DB keyed by LCSC codes instead of ids, which
+    an update assigns differently than a fresh build
+    """
+    conn = sqlite3.connect(path)
+    queries = {
+        "components": """
+            SELECT c.lcsc, cat.category, cat.subcategory, c.mfr, m.name, p.name, c.joints,
+                c.stock, c.basic, c.preferred, c.discontinued, c.price_at_moq,
+                d.description, d.datasheet, d.price, d.img, d.url, d.content_hash
+            FROM components c
+            JOIN component_details d USING(component_id)
+            JOIN categories cat USING(category_id)
+            LEFT JOIN manufacturers m USING(manufacturer_id)
+            LEFT JOIN packages p USING(package_id)
+            """,
+        "attributes": """
+            SELECT c.lcsc, k.name, t.json, v.value_json
+            FROM component_attributes a
+            JOIN components c USING(component_id)
+            JOIN attribute_keys k USING(attribute_key_id)
+            JOIN attribute_values v USING(attribute_value_id)
+            LEFT JOIN attribute_templates t USING(attribute_template_id)
+            """,
+        "numeric_attributes": """
+            SELECT c.lcsc, k.name, n.value_name, n.unit, n.numeric_value
+            FROM component_numeric_attributes n
+            JOIN components c USING(component_id)
+            JOIN attribute_keys k USING(attribute_key_id)
+            """,
+        "price_breaks": """
+            SELECT c.lcsc, p.q_from, p.q_to, p.unit_price
+            FROM price_breaks p JOIN components c USING(component_id)
+            """,
+        "mpns": """
+            SELECT m.normalized_mpn, c.lcsc
+            FROM component_mpns m JOIN components c USING(component_id)
+            """,
+        "fts": """
+            SELECT c.lcsc, f.lcsc, f.mfr, f.description
+            FROM component_fts f JOIN components c ON c.component_id = f.rowid
+            """,
+    }
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'component_mpns'").fetchone() is None:
+            del queries["mpns"]
+        # Fails if the external content FTS index doesn't match its content
+        conn.execute("INSERT INTO component_fts(component_fts, rank) VALUES ('integrity-check', 1)")
+        return {name: sorted(conn.execute(query), key=repr) for name, query in queries.items()}
+    finally:
+        conn.close()
+
+
+def change_library(library):
+    conn = sqlite3.connect(library)
+    with conn:
+        lcscs = [lcsc for (lcsc,) in conn.execute("SELECT lcsc FROM components ORDER BY lcsc")]
+        # Stock only
+        conn.execute("UPDATE components SET stock = stock + 7 WHERE lcsc IN (?, ?, ?)", lcscs[0:3])
+        # Price only, with a minimum order quantity and a tier less
+        conn.execute("UPDATE components SET price = ? WHERE lcsc = ?",
+                     (json.dumps([{"qFrom": 10, "qTo": None, "price": 0.5}]), lcscs[3]))
+        # Stock and description
+        conn.execute("""UPDATE components SET stock = 0, description = description || ' changed'
+                        WHERE lcsc = ?""", (lcscs[4],))
+        conn.execute("DELETE FROM components WHERE lcsc = ?", (lcscs[5],))
+        # A new component
+        row = conn.execute("SELECT * FROM components WHERE lcsc = ?", (lcscs[6],)).fetchone()
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(components)")]
+        new = dict(zip(columns, row), lcsc=lcscs[-1] + 1, mfr="NEW-MPN-1")
+        conn.execute(f"INSERT INTO components({', '.join(new)}) VALUES ({', '.join('?' * len(new))})",
+                     list(new.values()))
+    conn.close()
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"with_mpn_index": True, "fts_tokenizer": "trigram"},
+])
+def test_update_matches_fresh_build(library, tmp_path, capsys, options):
+    updated = str(tmp_path / "updated.sqlite3")
+    fresh = str(tmp_path / "fresh.sqlite3")
+    build_web_db(library, updated, **options)
+    before = component_contents(updated)
+
+    change_library(library)
+    capsys.readouterr()
+    update_web_db(library, updated, **options)
+    assert "1 inserted, 1 updated, 4 restocked, 1 deleted" in capsys.readouterr().out
+    build_web_db(library, fresh, **options)
+
+    expected = component_contents(fresh)
+    actual = component_contents(updated)
+    assert actual != before
+    for name in expected:
+        assert actual[name] == expected[name], name
+
+
+def test_trigram_index_is_queried_by_like(library, tmp_path):
+    output = str(tmp_path / "trigram.sqlite3")
+    build_web_db(library, output, fts_tokenizer="trigram")
+    conn = sqlite3.connect(output)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        assert meta["fts_query"] == "like"
+        mfr, expected = conn.execute("SELECT mfr, component_id FROM components LIMIT 1").fetchone()
+        found = [x for x, in conn.execute(
+            "SELECT rowid FROM component_fts WHERE mfr LIKE ?", (f"%{mfr[1:6]}%",))]
+        assert expected in found
+    finally:
+        conn.close()
@@ -140,17 +140,21 @@ function decodeAttributes(attributeIds, attributeLut) {
     return attributes;
 }
 
-function decodeComponentRow(row, schema, attributeLut) {
+function decodePrice(tiers) {
+    return (tiers || []).map(([qFrom, qTo, price]) => ({ qFrom, qTo, price }));
+}
+
+function decodeComponentRow(row, schema, attributeLut, stock, rowIdx) {
     return {
         lcsc: row[schema.lcsc],
         mfr: row[schema.mfr],
         joints: row[schema.joints],
         description: row[schema.description],
         datasheet: row[schema.datasheet],
-        price: row[schema.price],
+        price: stock ? decodePrice(stock.price[rowIdx]) : row[schema.price],
         img: row[schema.img],
         url: row[schema.url],
-        stock: row[schema.stock],
+        stock: stock ? stock.stock[rowIdx] : row[schema.stock],
         category: row[schema.subcategory],
         attributes: decodeAttributes(row[schema.attributes], attributeLut),
     };
@@ -288,6 +292,67 @@ async function ensureJsonFile(name) {
     }
 }
 
+function shardCategory(manifest, shardName) {
+    const subcategoryId = manifest.files[shardName]?.subcategoryId;
+    return manifest.categories.find(x => x.id === subcategoryId);
+}
+
+function joinAttributeValue(template, values) {
+    if (template === null) {
+        return values;
+    }
+    const value = { ...template, values: {} };
+    template.values.forEach(([quantity, unit], i) => {
+        value.values[quantity] = [values[i], unit];
+    });
+    return value;
+}
+
+const expandedLuts = new WeakMap();
+
+// LUT files store every distinct value template (format, primary value,
+// names and units of values) once and entries as [name, template index,
+// values]; expand them into [name, value] entries
+function expandAttributeLut(payload) {
+    if (Array.isArray(payload)) {
+        return payload;
+    }
+    let lut = expandedLuts.get(payload);
+    if (!lut) {
+        lut = payload.entries.map(([name, template, values]) =>
+            [name, joinAttributeValue(template === null ? null : payload.templates[template], values)]);
+        expandedLuts.set(payload, lut);
+    }
+    return lut;
+}
+
+// Attribute LUT is either global or there is one for each category
+async function shardAttributeLut(manifest, shardName) {
+    const name = shardCategory(manifest, shardName)?.attributesLut ?? manifest.attributesLut;
+    return expandAttributeLut(await ensureJsonFile(name));
+}
+
+// Stock and prices are stored separately from the shards in per-category
+// tables with arrays aligned with shard rows
+async function shardStock(manifest, shardName) {
+    const category = shardCategory(manifest, shardName);
+    if (!category?.stock || !category?.price) {
+        return null;
+    }
+    const [stockTable, priceTable] = await Promise.all([
+        ensureJsonFile(category.stock),
+        ensureJsonFile(category.price)
+    ]);
+    const idx = stockTable.shards.indexOf(shardName);
+    if (idx === -1) {
+        return null;
+    }
+    return {
+        stock: stockTable.stock[idx],
+        price: priceTable.price[idx]
+    };
+}
+
 export async function getCategories() {
     return (await getLocalManifest())?.categories ?? [];
 }
@@ -318,9 +383,11 @@ export async function updateComponentLibrary(report) {
 
     await storeManifest(manifest);
 
-    updateProgress("Metadata", ["Caching attributes", false]);
-    await ensureJsonFile(manifest.attributesLut);
-    updateProgress("Metadata", ["Ready", true]);
+    if (manifest.attributesLut) {
+        updateProgress("Metadata", ["Caching attributes", false]);
+        await ensureJsonFile(manifest.attributesLut);
+        updateProgress("Metadata", ["Ready", true]);
+    }
 }
 
 export async function checkForComponentLibraryUpdate() {
@@ -332,8 +399,13 @@ export async function checkForComponentLibraryUpdate() {
         if (!localManifest) {
             return true;
         }
-        return localManifest.version !== remoteManifest.version ||
-            localManifest.created !== remoteManifest.created;
+        if (localManifest.version !== remoteManifest.version) {
+            return true;
+        }
+        if (localManifest.contentHash && remoteManifest.contentHash) {
+            return localManifest.contentHash !== remoteManifest.contentHash;
+        }
+        return localManifest.created !== remoteManifest.created;
     } catch (error) {
         console.warn(error);
         return false;
@@ -361,18 +433,19 @@ export async function queryComponents({ categoryIds, allCategories, searchString
         return [];
     }
 
-    const attributeLut = await ensureJsonFile(manifest.attributesLut);
     const words = splitSearchWords(searchString);
     const results = [];
 
     for (const shardName of Array.from(new Set(shardNames))) {
         let schema = null;
+        const attributeLut = await shardAttributeLut(manifest, shardName);
+        const stock = await shardStock(manifest, shardName);
         const aborted = await streamJsonLines(shardName, (row, idx) => {
             if (idx === 0) {
                 schema = row;
                 return;
             }
-            const component = decodeComponentRow(row, schema, attributeLut);
+            const component = decodeComponentRow(row, schema, attributeLut, stock, idx - 1);
             if (matchesSearch(component, words)) {
                 results.push(component);
             }
@@ -388,13 +461,92 @@ export async function queryComponents({ categoryIds, allCategories, searchString
     return checkAbort?.() ? null : results;
 }
 
-function lookupFileForLcsc(manifest, lcsc) {
+function lcscNumber(lcsc) {
     const numeric = Number.parseInt(lcsc.slice(1), 10);
-    if (!Number.isFinite(numeric)) {
+    return Number.isFinite(numeric) ? numeric : null;
+}
+
+function lookupFileForLcsc(manifest, lcsc) {
+    const numeric = lcscNumber(lcsc);
+    if (numeric === null) {
         return null;
     }
     const bucket = Math.floor(numeric / manifest.lookupBucketSize);
-    return manifest.lookupBuckets[String(bucket)] ?? null;
+    return manifest.lcscIndex[String(bucket)] ?? null;
+}
+
+// The LCSC index stores ranges of LCSC numbers living in the same shard; the
+// range starts are delta-encoded
+const absoluteRangeStarts = new WeakMap();
+
+function shardForLcsc(index, lcsc) {
+    let starts = absoluteRangeStarts.get(index);
+    if (!starts) {
+        starts = new Array(index.starts.length);
+        let number = 0;
+        for (let i = 0; i < index.starts.length; i++) {
+            number += index.starts[i];
+            starts[i] = number;
+        }
+        absoluteRangeStarts.set(index, starts);
+    }
+    const numeric = lcscNumber(lcsc);
+    let lo = 0;
+    let hi = starts.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (starts[mid] <= numeric) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo === 0 ? null : index.shards[index.shardIndices[lo - 1]];
+}
+
+let crc32Table = null;
+
+function crc32(bytes) {
+    if (!crc32Table) {
+        crc32Table = new Uint32Array(256);
+        for (let i = 0; i < 256; i++) {
+            let c = i;
+            for (let k = 0; k < 8; k++) {
+                c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+            }
+            crc32Table[i] = c >>> 0;
+        }
+    }
+    let crc = 0xFFFFFFFF;
+    for (const byte of bytes) {
+        crc = crc32Table[(crc ^ byte) & 0xFF] ^ (crc >>> 8);
+    }
+    return (crc ^ 0xFFFFFFFF) >>> 0;
+}
+
+// Has to match normalizeMpn in jlcparts/searchindex.py
+function normalizeMpn(mfr) {
+    return mfr.replace(/[^0-9A-Za-z]+/g, "").toLowerCase();
+}
+
+// Find LCSC codes of components with the given MFR number. Only a single
+// small index file is fetched.
+export async function getLcscByMpn(mfr) {
+    const manifest = await getLocalManifest();
+    if (!manifest?.mpnIndex) {
+        return [];
+    }
+    const mpn = normalizeMpn(mfr);
+    if (mpn.length === 0) {
+        return [];
+    }
+    const partition = crc32(new TextEncoder().encode(mpn)) % manifest.mpnIndex.partitions;
+    const name = `mpn-${String(partition).padStart(4, "0")}.json.gz`;
+    if (!manifest.mpnIndex.files.includes(name)) {
+        return [];
+    }
+    const index = await ensureJsonFile(name);
+    return (index.mpns[mpn] ?? []).map(([lcsc, _]) => lcsc);
 }
 
 export async function getComponentByLcsc(lcsc) {
@@ -408,13 +560,14 @@ export async function getComponentByLcsc(lcsc) {
         return undefined;
     }
 
-    const lookup = await ensureJsonFile(lookupFile);
-    const shardName = lookup[lcsc];
+    const lcscIndex = await ensureJsonFile(lookupFile);
+    const shardName = shardForLcsc(lcscIndex, lcsc);
     if (!shardName) {
         return undefined;
     }
 
-    const attributeLut = await ensureJsonFile(manifest.attributesLut);
+    const attributeLut = await shardAttributeLut(manifest, shardName);
+    const stock = await shardStock(manifest, shardName);
     let schema = null;
     let found = undefined;
     await streamJsonLines(shardName, (row, idx) => {
@@ -425,7 +578,7 @@ export async function getComponentByLcsc(lcsc) {
         if (row[schema.lcsc] !== lcsc) {
             return;
         }
-        found = decodeComponentRow(row, schema, attributeLut);
+        found = decodeComponentRow(row, schema, attributeLut, stock, idx - 1);
         return 'abort';
     });
     return found;